@@ -3,26 +3,22 @@ Cotton Advisory RAG Chat Interface
 A professional ChatGPT-like interface for querying cotton pest and disease management information
 """
 import gradio as gr
-import pickle
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-import time
+import asyncio
+import sys
 import traceback
 
+# Shared retrieval modules live in backend/ so the API stays deployable on its own
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from rag_engine import get_engine
+
 # Load environment variables
 load_dotenv()
 
-# Global variables for caching
-embedder = None
-index = None
-texts = None
-metadatas = None
-model = None
+# Shared engine: index, chunks, embedder and Gemini client, each loaded once
+engine = get_engine()
 
 class CottonRAGSystem:
     """Professional RAG system with error handling and caching"""
@@ -31,39 +27,9 @@ class CottonRAGSystem:
         self.initialize_system()
     
     def initialize_system(self):
-        """Initialize all components with proper error handling"""
-        global embedder, index, texts, metadatas, model
-        
+        """Initialize all components with proper error handling (loads only once)"""
         try:
-            # Load API key
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY not found in environment variables")
-            
-            api_key = api_key.strip()
-            if not api_key.startswith('AIza'):
-                raise ValueError("Invalid API key format")
-            
-            # Configure Gemini
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemini-2.5-flash")
-            
-            # Load FAISS index and chunks
-            if not os.path.exists('chunks.pkl'):
-                raise FileNotFoundError("chunks.pkl not found. Please run chunk_and_embed.py first")
-            if not os.path.exists('faiss_index.bin'):
-                raise FileNotFoundError("faiss_index.bin not found. Please run chunk_and_embed.py first")
-            
-            with open('chunks.pkl', 'rb') as f:
-                chunk_data = pickle.load(f)
-                texts = chunk_data['texts']
-                metadatas = chunk_data['metadatas']
-            
-            index = faiss.read_index('faiss_index.bin')
-            
-            # Load embedding model (CPU only for compatibility)
-            embedder = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-            
+            engine.ensure_loaded()
             return True, "✅ System initialized successfully!"
             
         except Exception as e:
@@ -74,101 +40,51 @@ class CottonRAGSystem:
     
     def retrieve(self, query: str, k: int = 5) -> List[Dict]:
         """Retrieve relevant chunks with error handling"""
-        try:
-            if embedder is None or index is None:
-                raise RuntimeError("System not initialized properly")
-            
-            query_emb = embedder.encode([query], convert_to_numpy=True)
-            D, I = index.search(query_emb, k)
-            
-            results = []
-            for idx in I[0]:
-                if idx < len(texts):  # Validate index
-                    results.append({
-                        'text': texts[idx],
-                        'metadata': metadatas[idx],
-                        'distance': float(D[0][len(results)])
-                    })
-            
-            return results
-        except Exception as e:
-            print(f"Retrieval error: {e}")
-            raise
+        return engine.retrieve(query, k)
     
     def format_context_with_citations(self, results: List[Dict]) -> str:
         """Format retrieved context with page citations"""
-        context = ""
-        for i, r in enumerate(results, 1):
-            page = r['metadata'].get('page_label', r['metadata'].get('page', '?'))
-            context += f"[Source p.{page}] {r['text']}\n\n"
-        return context
+        return engine.format_context_with_citations(results, pack=False)
     
-    def answer_question(self, query: str, max_retries: int = 3) -> Tuple[str, bool]:
+    async def answer_question(self, query: str) -> Tuple[str, bool]:
         """
-        Answer a question with retry logic and error handling
+        Answer a question with error handling; only the Gemini call is retried
+        (by the shared LLM client), retrieval runs once
         Returns: (answer, success)
         """
         if not query or not query.strip():
             return "⚠️ Please enter a question about cotton pest and disease management.", False
         
-        for attempt in range(max_retries):
-            try:
-                # Retrieve relevant context
-                retrieved = self.retrieve(query, k=5)
-                
-                if not retrieved:
-                    return "⚠️ No relevant information found in the knowledge base. Please try rephrasing your question.", False
-                
-                context = self.format_context_with_citations(retrieved)
-                
-                # Create prompt
-                prompt = f"""You are a Cotton Pest and Disease Management expert assistant. Answer the following question using ONLY the provided context from the ICAR-CICR Advisory document.
-
-Guidelines:
-- Provide accurate, actionable information for cotton farmers
-- Cite sources using [Source p.X] format for every fact
-- If the context doesn't contain the answer, clearly state that
-- Be concise but comprehensive
-- Use bullet points for multiple items
-- Focus on practical recommendations
-
-Context:
-{context}
-
-Question: {query}
-
-Answer:"""
-                
-                # Get response from Gemini
-                if model is None:
-                    raise RuntimeError("Gemini model not initialized")
-                
-                response = model.generate_content(prompt)
-                answer = response.text
-                
-                # Validate answer
-                if not answer or len(answer.strip()) < 10:
-                    raise ValueError("Generated answer too short or empty")
-                
-                return answer, True
-                
-            except Exception as e:
-                error_type = type(e).__name__
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                    continue
-                else:
-                    # Final attempt failed
-                    error_msg = f"❌ Error: {error_type} - {str(e)}\n\n"
-                    error_msg += "Please try again or contact support if the issue persists."
-                    return error_msg, False
-        
-        return "❌ Maximum retry attempts reached. Please try again later.", False
+        try:
+            # Retrieve relevant context
+            retrieved = await asyncio.to_thread(self.retrieve, query, 5)
+            
+            if not retrieved:
+                return "⚠️ No relevant information found in the knowledge base. Please try rephrasing your question.", False
+            
+            context = self.format_context_with_citations(retrieved)
+            
+            # Create prompt
+            prompt = engine.build_prompt(query, context, grounded_only=True)
+            
+            # Get response from Gemini (timeout, jittered retries and circuit breaker)
+            answer = await engine.generate(prompt)
+            
+            # Validate answer
+            if not answer or len(answer.strip()) < 10:
+                raise ValueError("Generated answer too short or empty")
+            
+            return answer, True
+            
+        except Exception as e:
+            error_msg = f"❌ Error: {type(e).__name__} - {str(e)}\n\n"
+            error_msg += "Please try again or contact support if the issue persists."
+            return error_msg, False
 
 # Initialize the RAG system
 rag_system = CottonRAGSystem()
 
-def chat_interface(message: str, history: List[List[str]]) -> Tuple[str, List[List[str]]]:
+async def chat_interface(message: str, history: List[List[str]]) -> Tuple[str, List[List[str]]]:
     """
     Chat interface function for Gradio
     Args:
@@ -181,7 +97,7 @@ def chat_interface(message: str, history: List[List[str]]) -> Tuple[str, List[Li
         return history
     
     # Generate response
-    answer, success = rag_system.answer_question(message)
+    answer, success = await rag_system.answer_question(message)
     
     # Add to history
     history.append([message, answer])
@@ -384,12 +300,12 @@ def create_interface():
         """)
         
         # Event handlers
-        def respond(message, chat_history):
+        async def respond(message, chat_history):
             if not message.strip():
                 return chat_history, ""
             
             # Generate bot response
-            answer, success = rag_system.answer_question(message)
+            answer, success = await rag_system.answer_question(message)
             
             # Gradio 6.0 format: list of dicts with 'role' and 'content'
             chat_history.append({"role": "user", "content": message})
@@ -0,0 +1,151 @@
+"""
+Semantic answer cache
+Returns a previously generated answer when a new query's embedding is within a
+cosine-similarity threshold of a cached query, so near-duplicate questions skip
+retrieval and the LLM call. Each entry carries a scope (e.g. a digest of the
+conversation it was answered in) and only matches lookups with the same scope.
+Cached queries live in a small FAISS inner-product index; entries expire after
+a TTL, are evicted LRU-first, and are all dropped when the document index file
+changes.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Embedding-keyed answer cache with TTL, LRU eviction and index invalidation"""
+
+    def __init__(self, threshold: float = 0.92, ttl: float = 3600, maxsize: int = 1024,
+                 index_path: Optional[str] = None, check_interval: float = 5.0, candidates: int = 8):
+        self.threshold = threshold
+        self.candidates = candidates
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.index_path = index_path
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._vectors = None
+        self._next_id = 0
+        self._index_signature = self._current_signature()
+        self._last_check = time.monotonic()
+
+    def _current_signature(self):
+        if not self.index_path:
+            return None
+        try:
+            st = os.stat(self.index_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _check_index_changed(self):
+        """Drop every entry if the document index was rebuilt (call with lock held)"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        signature = self._current_signature()
+        if signature != self._index_signature:
+            self._index_signature = signature
+            self._clear_locked()
+            self.invalidations += 1
+
+    def _clear_locked(self):
+        self._entries.clear()
+        if self._vectors is not None:
+            self._vectors.reset()
+
+    def _remove_locked(self, entry_id: int):
+        self._entries.pop(entry_id, None)
+        self._vectors.remove_ids(np.array([entry_id], dtype=np.int64))
+
+    @staticmethod
+    def _normalize(query_emb: np.ndarray) -> np.ndarray:
+        vec = np.array(query_emb, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def lookup(self, query_emb: np.ndarray, scope: str = "") -> Optional[Dict]:
+        """Return {'answer', 'sources', 'query', 'similarity'} for a near-duplicate query in scope, or None"""
+        vec = self._normalize(query_emb)
+        with self._lock:
+            self._check_index_changed()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            # The nearest entries may belong to other scopes; take the closest one in this scope
+            D, I = self._vectors.search(vec, min(self.candidates, len(self._entries)))
+            entry = None
+            for entry_id, similarity in zip(I[0].tolist(), D[0].tolist()):
+                if entry_id < 0 or similarity < self.threshold:
+                    break
+                candidate = self._entries.get(entry_id)
+                if candidate is not None and candidate['scope'] == scope:
+                    entry = candidate
+                    break
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - entry['created'] > self.ttl:
+                self._remove_locked(entry_id)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return {
+                'answer': entry['answer'],
+                'sources': entry['sources'],
+                'query': entry['query'],
+                'similarity': similarity,
+            }
+
+    def store(self, query: str, query_emb: np.ndarray, answer: str, sources: List[Dict], scope: str = ""):
+        """Cache an answer under the query embedding and scope"""
+        vec = self._normalize(query_emb)
+        with self._lock:
+            self._check_index_changed()
+            if self._vectors is None:
+                self._vectors = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._vectors.add_with_ids(vec, np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                'query': query,
+                'answer': answer,
+                'sources': sources,
+                'scope': scope,
+                'created': time.monotonic(),
+            }
+            while len(self._entries) > self.maxsize:
+                oldest_id = next(iter(self._entries))
+                self._remove_locked(oldest_id)
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
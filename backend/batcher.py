@@ -0,0 +1,122 @@
+"""
+Dynamic micro-batching for concurrent requests
+Items submitted within a short window (up to a maximum batch size) are handed
+to one batch function call on the CPU executor, and each caller receives its
+own result. Used to turn many single-query embed/search calls into one
+batched SentenceTransformer.encode and one multi-row FAISS search.
+"""
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    """Collects concurrent submissions and processes them with one batch call"""
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], executor: Executor,
+                 max_batch: int = 32, max_wait_ms: float = 5.0, max_concurrent_batches: int = 1,
+                 name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._arrived: Optional[asyncio.Event] = None
+        self._collecting: List = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._arrived = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result from the next batch"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        self._arrived.set()
+        return await future
+
+    async def _collect(self) -> List:
+        """Wait for one item, then gather more until the batch is full or the window closes"""
+        batch = self._collecting = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        # Items are only ever taken with get_nowait; the timed wait is on the
+        # arrival event, so a timeout racing a put can drop a wake-up but never
+        # an item (wait_for around queue.get() can, before Python 3.12)
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            await self._slots.acquire()
+            self._collecting = []
+            loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List):
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.batches += 1
+            self.items += len(batch)
+            self._slots.release()
+
+    async def close(self):
+        """Stop the collector task, cancelling items that were queued but not dispatched"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            pending = self._collecting
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for _, future in pending:
+                if not future.done():
+                    future.cancel()
+            self._collecting = []
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,98 @@
+"""
+Embedding backend benchmark
+Loads each backend in a fresh process and reports cold start (imports +
+model load), resident memory, single-query latency and batch throughput,
+plus whether torch ended up imported.
+
+Usage:
+    python bench_embedders.py
+    python bench_embedders.py --backends onnx --queries 500 --output embedders.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from embedders import DEFAULT_ONNX_PATH, EMBEDDING_BACKENDS
+from export_onnx import SAMPLE_QUERIES
+
+
+def _worker(backend, onnx_path, n_queries, batch_size, results):
+    import sys
+    from metrics import process_memory
+
+    start = time.perf_counter()
+    from embedders import load_embedder
+    embedder = load_embedder(backend, onnx_path)
+    load_seconds = time.perf_counter() - start
+
+    first_start = time.perf_counter()
+    embedder.encode([SAMPLE_QUERIES[0]], convert_to_numpy=True)
+    first_query_ms = (time.perf_counter() - first_start) * 1000
+
+    queries = [f"{SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]} ({i})" for i in range(n_queries)]
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        embedder.encode([query], convert_to_numpy=True)
+        latencies.append(time.perf_counter() - t0)
+
+    batch_start = time.perf_counter()
+    embedder.encode(queries, batch_size=batch_size, convert_to_numpy=True)
+    batch_seconds = time.perf_counter() - batch_start
+
+    latencies_ms = np.array(latencies) * 1000
+    results.put({
+        "backend": backend,
+        "cold_start_s": round(load_seconds, 2),
+        "first_query_ms": round(first_query_ms, 1),
+        "rss_mib": round((process_memory()["rss_bytes"] or 0) / (1024 * 1024), 1),
+        "query_p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "batch_qps": round(len(queries) / batch_seconds, 1),
+        "torch_imported": "torch" in sys.modules,
+    })
+
+
+def run(backend, onnx_path, n_queries, batch_size):
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_worker, args=(backend, onnx_path, n_queries, batch_size, results))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        return {"backend": backend, "error": f"worker exited with code {proc.exitcode}"}
+    return results.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start, memory and latency of the embedding backends")
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--onnx-path", default=DEFAULT_ONNX_PATH)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'backend':<9}{'cold s':>8}{'first ms':>10}{'rss MiB':>9}{'p50 ms':>8}{'p95 ms':>8}{'batch q/s':>11}{'torch':>7}")
+    for backend in args.backends:
+        row = run(backend, args.onnx_path, args.queries, args.batch_size)
+        rows.append(row)
+        if "error" in row:
+            print(f"{backend:<9}{row['error']}")
+            continue
+        print(f"{row['backend']:<9}{row['cold_start_s']:>8}{row['first_query_ms']:>10}{row['rss_mib']:>9}"
+              f"{row['query_p50_ms']:>8}{row['query_p95_ms']:>8}{row['batch_qps']:>11}"
+              f"{'yes' if row['torch_imported'] else 'no':>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✓ Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Offline retrieval benchmark
+Times each retrieval step in isolation, using the shipped faiss_index.bin and
+chunk_store and the shared engine the API uses (rag_engine.py, so RETRIEVAL_MODE,
+RERANK_ENABLED, EMBEDDING_BACKEND etc. apply). No network or LLM calls.
+
+Steps:
+    embed      query embedding (encoder only, no embedding cache)
+    search     index search + chunk lookup for a precomputed embedding
+    format     prompt context formatting / packing of the search results
+    retrieve   end to end: embed + search + format, with a cold embedding cache
+
+Each step reports p50/p95/p99 latency, throughput and the peak Python heap
+allocation during the step (measured in a separate tracemalloc pass, so it
+doesn't distort the timings), plus the process's peak RSS.
+
+Usage:
+    python bench_retrieval.py --output bench.json --save-baseline bench_baseline.json
+    python bench_retrieval.py --baseline bench_baseline.json   # exit code 1 on regression
+
+A step regresses when p50/p95 latency or peak allocation grows, or throughput
+drops, by more than --tolerance (p99 is reported but too noisy to gate on).
+Baselines are machine specific: record them on the machine that runs the comparison.
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from export_onnx import SAMPLE_QUERIES
+
+TEST_RAG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_rag.py")
+STEPS = ("embed", "search", "format", "retrieve")
+# Metric name -> True if larger is worse
+GATED_METRICS = {"p50_ms": True, "p95_ms": True, "qps": False, "peak_alloc_kib": True}
+
+
+def load_test_questions(path: str = TEST_RAG_PATH) -> list:
+    """TEST_QUESTIONS from test_rag.py, read without importing it (it calls Gemini)"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+    except OSError:
+        return list(SAMPLE_QUERIES)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "TEST_QUESTIONS" for t in node.targets):
+            return ast.literal_eval(node.value)
+    return list(SAMPLE_QUERIES)
+
+
+def _summarize(latencies: list) -> dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "iterations": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "qps": round(len(ms) / ms.sum() * 1000, 1) if ms.sum() else None,
+    }
+
+
+def _time_step(func, inputs, warmup: int, before=None) -> list:
+    for item in inputs[:warmup]:
+        if before:
+            before()
+        func(item)
+    latencies = []
+    for item in inputs:
+        if before:
+            before()
+        t0 = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def _peak_alloc_kib(func, inputs, before=None) -> float:
+    """Largest Python heap growth during a single call"""
+    peak = 0
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            if before:
+                before()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            func(item)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def run(n_queries: int, k: int, warmup: int) -> dict:
+    from dotenv import load_dotenv
+    from embedding_cache import embedding_cache
+    from metrics import process_memory
+    from rag_engine import get_engine
+
+    load_dotenv()
+    engine = get_engine()
+    load_start = time.perf_counter()
+    engine.ensure_retrieval()
+    load_seconds = time.perf_counter() - load_start
+
+    questions = load_test_questions()
+    queries = [questions[i % len(questions)] for i in range(n_queries)]
+    embeddings = [engine.embedder.encode([q], convert_to_numpy=True) for q in queries]
+    searched = [engine.search(emb, k, q) for emb, q in zip(embeddings, queries)]
+
+    def retrieve(query):
+        engine.format_context_with_citations(engine.retrieve(query, k))
+
+    steps = {
+        "embed": (lambda q: engine.embedder.encode([q], convert_to_numpy=True), queries, None),
+        "search": (lambda pair: engine.search(pair[0], k, pair[1]), list(zip(embeddings, queries)), None),
+        "format": (engine.format_context_with_citations, searched, None),
+        "retrieve": (retrieve, queries, embedding_cache.clear),
+    }
+    results = {}
+    for name, (func, inputs, before) in steps.items():
+        results[name] = _summarize(_time_step(func, inputs, warmup, before))
+        results[name]["peak_alloc_kib"] = _peak_alloc_kib(func, inputs[:min(len(inputs), 50)], before)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "queries": n_queries,
+            "k": k,
+            "vectors": engine.index.ntotal,
+            "index": engine.index_stats(),
+            "retrieval_mode": engine.retrieval_mode,
+            "rerank": engine.reranker is not None,
+            "embedding_backend": engine.embedding_backend,
+            "load_seconds": round(load_seconds, 2),
+        },
+        "steps": results,
+        "peak_rss_mib": round((process_memory()["peak_rss_bytes"] or 0) / (1024 * 1024), 1),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Regressions of the current run against the baseline, as printable lines"""
+    regressions = []
+    for step, base in baseline.get("steps", {}).items():
+        now = current["steps"].get(step)
+        if now is None:
+            continue
+        for metric, larger_is_worse in GATED_METRICS.items():
+            old, new = base.get(metric), now.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            # Ignore sub-threshold jitter on steps that take microseconds
+            if metric == "qps":
+                delta_ms = abs(now.get("mean_ms", 0) - base.get("mean_ms", 0))
+            else:
+                delta_ms = abs(new - old) if metric.endswith("_ms") else None
+            if delta_ms is not None and delta_ms < min_delta_ms:
+                continue
+            if (change if larger_is_worse else -change) > tolerance:
+                regressions.append(f"{step} {metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency, throughput and memory of the retrieval steps")
+    parser.add_argument("--queries", type=int, default=200, help="Timed iterations per step")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against this results file; exit 1 on regression")
+    parser.add_argument("--save-baseline", help="Also write the results to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    result = run(args.queries, args.k, args.warmup)
+
+    print(f"{'step':<10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/s':>10}{'alloc KiB':>11}")
+    for name, row in result["steps"].items():
+        print(f"{name:<10}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['qps']:>10}{row['peak_alloc_kib']:>11}")
+    print(f"peak RSS: {result['peak_rss_mib']} MiB, {result['meta']['vectors']} vectors, "
+          f"load {result['meta']['load_seconds']}s")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(result, f, indent=2)
+            print(f"✓ Results saved to: {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Multi-worker index memory benchmark
+Starts N worker processes that each load the FAISS index and chunk store
+through the shared engine, as the API does (so the recorded search parameters
+and FAISS_NPROBE / FAISS_EF_SEARCH overrides apply), then reports per-worker memory and search latency for heap
+and memory-mapped loading.
+
+Usage:
+    python bench_workers.py --workers 1 4 8 --queries 500
+    python bench_workers.py --index big_index.bin --mode mmap
+
+Memory figures come from /proc/<pid>/smaps_rollup (Linux only):
+    rss   resident memory including shared pages
+    anon  private heap memory (what each extra worker really costs)
+    pss   proportional share: shared pages divided among the processes using them;
+          the sum of PSS over all workers is the true total footprint
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+
+def _smaps_rollup():
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024
+    except OSError:
+        pass
+    return fields
+
+
+def _worker(index_path, store_path, use_mmap, n_queries, k, start_barrier, report_barrier, results):
+    from rag_engine import RAGEngine
+
+    engine = RAGEngine(chunk_store_path=store_path, index_path=index_path)
+    engine.faiss_mmap = use_mmap
+    index = engine.load_index()
+    store = engine.load_chunks() if os.path.exists(store_path) else None
+    rng = np.random.default_rng(os.getpid())
+    queries = rng.standard_normal((n_queries, index.d)).astype(np.float32)
+
+    start_barrier.wait()
+    latencies = []
+    for i in range(n_queries):
+        t0 = time.perf_counter()
+        D, I = index.search(queries[i:i + 1], k)
+        if store is not None:
+            # Index results are chunk ids (not rows) for ID-mapped indexes
+            for row in store.rows_for_ids(I[0]):
+                if row >= 0:
+                    store.text(row)
+        latencies.append(time.perf_counter() - t0)
+
+    # Measure while every worker is still alive so shared pages are split correctly
+    report_barrier.wait()
+    mem = _smaps_rollup()
+    results.put({
+        "pid": os.getpid(),
+        "rss": mem.get("Rss"),
+        "anon": mem.get("Anonymous"),
+        "pss": mem.get("Pss"),
+        "latencies": latencies,
+    })
+    report_barrier.wait()
+
+
+def run(index_path, store_path, workers, use_mmap, n_queries, k):
+    ctx = mp.get_context("spawn")
+    start_barrier = ctx.Barrier(workers)
+    report_barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(index_path, store_path, use_mmap, n_queries, k,
+                                          start_barrier, report_barrier, results))
+        for _ in range(workers)
+    ]
+    wall_start = time.perf_counter()
+    for p in procs:
+        p.start()
+    reports = [results.get() for _ in range(workers)]
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - wall_start
+
+    latencies = np.array([lat for r in reports for lat in r["latencies"]]) * 1000
+    mib = 1024 * 1024
+
+    def avg(key):
+        values = [r[key] for r in reports if r[key] is not None]
+        return round(sum(values) / len(values) / mib, 1) if values else None
+
+    return {
+        "mode": "mmap" if use_mmap else "heap",
+        "workers": workers,
+        "rss_per_worker_mib": avg("rss"),
+        "anon_per_worker_mib": avg("anon"),
+        "pss_per_worker_mib": avg("pss"),
+        "pss_total_mib": round(sum(r["pss"] or 0 for r in reports) / mib, 1),
+        "search_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "search_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "search_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "wall_seconds": round(wall, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker RSS and search latency for heap vs mmap index loading")
+    parser.add_argument("--index", default="faiss_index.bin")
+    parser.add_argument("--store", default="chunk_store")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--mode", choices=["heap", "mmap", "both"], default="both")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    modes = [False, True] if args.mode == "both" else [args.mode == "mmap"]
+    rows = []
+    print(f"{'mode':<6}{'workers':>8}{'rss/wkr':>10}{'anon/wkr':>10}{'pss/wkr':>10}{'pss tot':>10}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for use_mmap in modes:
+        for workers in args.workers:
+            row = run(args.index, args.store, workers, use_mmap, args.queries, args.k)
+            rows.append(row)
+            print(f"{row['mode']:<6}{row['workers']:>8}{row['rss_per_worker_mib']:>10}{row['anon_per_worker_mib']:>10}"
+                  f"{row['pss_per_worker_mib']:>10}{row['pss_total_mib']:>10}"
+                  f"{row['search_p50_ms']:>9}{row['search_p95_ms']:>9}{row['search_p99_ms']:>9}")
+    print("(memory in MiB)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✓ Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Prebuilt BM25 inverted index for lexical retrieval
+Dense MiniLM embeddings often miss exact pesticide names and dosage strings
+such as "Profenophos 50 EC". This index catches them. BM25 impact scores are
+precomputed per posting at build time, so a query only touches the postings
+of its own terms. It never scans the chunk texts.
+
+Layout of an index directory:
+    vocab.json    parameters, document count and the term list (term id = position)
+    offsets.npy   int64[V + 1] start of each term's postings
+    doc_ids.npy   int64[P] chunk ids, grouped by term
+    weights.npy   float32[P] precomputed BM25 impact of the term in that chunk
+    tfs.npy       int32[P] term frequency of each posting
+    docs.npy      int64[N] chunk ids of the indexed chunks, ascending
+    lengths.npy   int32[N] token count of each indexed chunk
+
+Postings are keyed by stable chunk id (see chunk_store.py), so
+update_bm25_index can drop removed chunks and add new ones without
+re-tokenizing the rest of the corpus.
+
+Build from an existing chunk store with:
+    python bm25_index.py chunk_store bm25_index
+"""
+import json
+import math
+import os
+import re
+import shutil
+import sys
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_FORMULATION_RE = re.compile(r"^[a-z]{1,3}$")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word/number tokens. A number followed by a short formulation
+    code also yields a joined token ("50 EC" -> "50ec", "20 %SG" -> "20sg").
+    This keeps dosage strings distinctive.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    joined = [
+        tokens[i] + tokens[i + 1]
+        for i in range(len(tokens) - 1)
+        if tokens[i][0].isdigit() and _FORMULATION_RE.match(tokens[i + 1])
+    ]
+    return tokens + joined
+
+
+def _postings(chunks: Iterable[Tuple[int, str]]):
+    """Tokenize (chunk_id, text) pairs into (terms, posting term ids, chunk ids, tfs, chunk ids, lengths)"""
+    term_ids: Dict[str, int] = {}
+    p_terms, p_docs, p_tfs, docs, lengths = [], [], [], [], []
+    for chunk_id, text in chunks:
+        counts = Counter(tokenize(text))
+        docs.append(chunk_id)
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            p_terms.append(term_ids.setdefault(term, len(term_ids)))
+            p_docs.append(chunk_id)
+            p_tfs.append(tf)
+    return (list(term_ids), np.asarray(p_terms, dtype=np.int64), np.asarray(p_docs, dtype=np.int64),
+            np.asarray(p_tfs, dtype=np.int32), np.asarray(docs, dtype=np.int64),
+            np.asarray(lengths, dtype=np.int32))
+
+
+def _write_index(path: str, k1: float, b: float, vocab: List[str], p_terms: np.ndarray, p_docs: np.ndarray,
+                 p_tfs: np.ndarray, docs: np.ndarray, lengths: np.ndarray):
+    """
+    Sort postings by term and chunk id, compute their BM25 impacts and write
+    the index. vocab must be sorted; p_terms index into it. Terms left without
+    postings are dropped.
+    """
+    order = np.lexsort((p_docs, p_terms))
+    p_terms, p_docs, p_tfs = p_terms[order], p_docs[order], p_tfs[order]
+    used, p_terms = np.unique(p_terms, return_inverse=True)
+    vocab = [vocab[i] for i in used]
+    order = np.argsort(docs, kind='stable')
+    docs, lengths = docs[order], lengths[order]
+
+    n_docs = len(docs)
+    avgdl = float(lengths.mean()) if n_docs else 0.0
+    df = np.bincount(p_terms, minlength=len(vocab))
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+    idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+    tf = p_tfs.astype(np.float32)
+    doc_lengths = lengths[np.searchsorted(docs, p_docs)].astype(np.float32)
+    norm = k1 * (1 - b + b * doc_lengths / avgdl) if avgdl else k1
+    weights = (idf[p_terms] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    for name, array in (('offsets', offsets), ('doc_ids', p_docs), ('weights', weights), ('tfs', p_tfs),
+                        ('docs', docs), ('lengths', lengths)):
+        np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+    with open(os.path.join(tmp_path, 'vocab.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': FORMAT_VERSION, 'k1': k1, 'b': b, 'documents': n_docs,
+                   'avgdl': avgdl, 'terms': vocab}, f, ensure_ascii=False)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def build_bm25_index(texts: Iterable[str], path: str, k1: float = 1.5, b: float = 0.75,
+                     ids: Optional[Iterable[int]] = None):
+    """Tokenize chunk texts (with their chunk ids; row numbers otherwise) and write the inverted index"""
+    chunks = zip(ids, texts) if ids is not None else enumerate(texts)
+    terms, p_terms, p_docs, p_tfs, docs, lengths = _postings((int(i), text) for i, text in chunks)
+    vocab = sorted(terms)
+    position = {term: i for i, term in enumerate(vocab)}
+    remap = np.asarray([position[term] for term in terms], dtype=np.int64)
+    _write_index(path, k1, b, vocab, remap[p_terms], p_docs, p_tfs, docs, lengths)
+
+
+def bm25_index_current(path: str) -> bool:
+    """Whether path holds an index in the current format (one update_bm25_index can extend)"""
+    try:
+        with open(os.path.join(path, 'vocab.json'), encoding='utf-8') as f:
+            return json.load(f).get('version') == FORMAT_VERSION
+    except (OSError, ValueError):
+        return False
+
+
+def update_bm25_index(path: str, removed_ids: Iterable[int], chunks: Iterable[Tuple[int, str]]):
+    """
+    Drop the postings of removed chunk ids and add those of new (chunk_id, text)
+    pairs. Only the new chunks are tokenized; kept postings are reused, and
+    their impacts are recomputed from the stored term frequencies because
+    document frequencies and the average length change with the corpus.
+    """
+    with open(os.path.join(path, 'vocab.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported BM25 index version: {meta.get('version')}")
+    offsets = np.load(os.path.join(path, 'offsets.npy'))
+    p_docs = np.load(os.path.join(path, 'doc_ids.npy'))
+    p_tfs = np.load(os.path.join(path, 'tfs.npy'))
+    docs = np.load(os.path.join(path, 'docs.npy'))
+    lengths = np.load(os.path.join(path, 'lengths.npy'))
+    p_terms = np.repeat(np.arange(len(meta['terms']), dtype=np.int64), np.diff(offsets))
+
+    removed = np.fromiter((int(i) for i in removed_ids), dtype=np.int64)
+    kept = ~np.isin(p_docs, removed)
+    kept_docs = ~np.isin(docs, removed)
+    new_terms, new_p_terms, new_p_docs, new_p_tfs, new_docs, new_lengths = _postings(chunks)
+
+    vocab = sorted(set(meta['terms']).union(new_terms))
+    position = {term: i for i, term in enumerate(vocab)}
+    old_remap = np.asarray([position[term] for term in meta['terms']], dtype=np.int64)
+    new_remap = np.asarray([position[term] for term in new_terms], dtype=np.int64)
+    _write_index(
+        path, meta['k1'], meta['b'], vocab,
+        np.concatenate([old_remap[p_terms[kept]], new_remap[new_p_terms]]),
+        np.concatenate([p_docs[kept], new_p_docs]),
+        np.concatenate([p_tfs[kept], new_p_tfs]),
+        np.concatenate([docs[kept_docs], new_docs]),
+        np.concatenate([lengths[kept_docs], new_lengths]),
+    )
+
+
+class BM25Index:
+    """Memory-mapped BM25 postings with top-k search"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, 'vocab.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index version: {meta.get('version')}")
+        self.documents = meta['documents']
+        self._term_ids = {term: i for i, term in enumerate(meta['terms'])}
+        self._offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self._doc_ids = np.load(os.path.join(path, 'doc_ids.npy'), mmap_mode='r')
+        self._weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return self.documents
+
+    def search(self, query: str, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, chunk_ids) of the top-k chunks, best first"""
+        ids, weights = [], []
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self._offsets[term_id]), int(self._offsets[term_id + 1])
+            ids.append(self._doc_ids[start:end])
+            weights.append(self._weights[start:end])
+        if not ids:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        docs, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        if len(docs) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(docs))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return scores[top].astype(np.float32), docs[top].astype(np.int64)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int, c: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists: score(d) = sum over lists of 1 / (c + rank(d))"""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            if doc_id >= 0:
+                scores[int(doc_id)] += 1.0 / (c + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+if __name__ == "__main__":
+    from chunk_store import ChunkStore
+
+    if len(sys.argv) != 3:
+        print("Usage: python bm25_index.py <chunk_store_dir> <output_dir>")
+        sys.exit(1)
+
+    store = ChunkStore(sys.argv[1])
+    build_bm25_index(store.texts, sys.argv[2], ids=store.ids)
+    print(f"Indexed {len(store)} chunks into {sys.argv[2]}")
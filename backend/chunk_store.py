@@ -0,0 +1,259 @@
+"""
+Memory-mapped chunk store
+Replaces chunks.pkl with a compact on-disk layout that is opened with mmap, so
+startup is near-instant, worker processes share pages through the OS page
+cache, and only the chunks a search returns are ever decoded.
+
+Layout of a store directory:
+    offsets.npy     uint64[n + 1] byte offsets of each chunk in texts.bin
+    texts.bin       UTF-8 text of all chunks, concatenated
+    meta.json       format version, chunk count and per-column value dictionaries
+    col_<name>.npy  int32[n] dictionary codes for each metadata column (-1 = missing)
+    ids.npy         int64[n] stable chunk ids, ascending (optional; row number otherwise)
+
+Chunk ids are the ids stored in an ID-mapped FAISS index, so chunks keep their
+id when documents are added or removed and the rows around them move.
+
+Convert an existing pickle once with:
+    python chunk_store.py chunks.pkl chunk_store
+"""
+import json
+import mmap
+from array import array
+import os
+import shutil
+import sys
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class _TextView(Sequence):
+    """List-like view decoding chunk texts on access"""
+
+    def __init__(self, store: "ChunkStore"):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._store.text(j) for j in range(*i.indices(len(self)))]
+        return self._store.text(i)
+
+
+class _MetadataView(_TextView):
+    """List-like view building metadata dicts on access"""
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._store.metadata(j) for j in range(*i.indices(len(self)))]
+        return self._store.metadata(i)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped chunk texts and columnar metadata"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk store version: {meta.get('version')}")
+
+        self._offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self._count = int(meta['count'])
+        if len(self._offsets) != self._count + 1:
+            raise ValueError("Chunk store is corrupt: offsets do not match chunk count")
+
+        self._blob_file = open(os.path.join(path, 'texts.bin'), 'rb')
+        if os.fstat(self._blob_file.fileno()).st_size:
+            self._blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._blob = b""
+
+        self._columns = {}
+        for name, values in meta['columns'].items():
+            codes = np.load(os.path.join(path, f'col_{name}.npy'), mmap_mode='r')
+            self._columns[name] = (codes, values)
+        
+        ids_path = os.path.join(path, 'ids.npy')
+        self.ids = np.load(ids_path, mmap_mode='r') if os.path.exists(ids_path) else None
+        if self.ids is not None and len(self.ids) != self._count:
+            raise ValueError("Chunk store is corrupt: ids do not match chunk count")
+
+        self.texts = _TextView(self)
+        self.metadatas = _MetadataView(self)
+
+    def __len__(self):
+        return self._count
+
+    def _check(self, i: int) -> int:
+        i = int(i)
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(f"chunk index {i} out of range")
+        return i
+
+    def text(self, i: int) -> str:
+        i = self._check(i)
+        return self._blob[int(self._offsets[i]):int(self._offsets[i + 1])].decode('utf-8')
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        i = self._check(i)
+        result = {}
+        for name, (codes, values) in self._columns.items():
+            code = int(codes[i])
+            if code >= 0:
+                result[name] = values[code]
+        return result
+
+    def chunk_id(self, i: int) -> int:
+        i = self._check(i)
+        return int(self.ids[i]) if self.ids is not None else i
+
+    def rows_for_ids(self, ids) -> np.ndarray:
+        """Map chunk ids (e.g. FAISS search results) to row numbers; unknown ids map to -1"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.ids is None:
+            return np.where((ids >= 0) & (ids < self._count), ids, -1)
+        if not self._count:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, ids), self._count - 1)
+        return np.where((ids >= 0) & (self.ids[rows] == ids), rows, -1)
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._blob_file.close()
+
+
+class ChunkStoreWriter:
+    """
+    Streams chunks into a new store.
+    Texts are appended to disk as they arrive; only offsets, ids and metadata
+    codes stay in memory, as compact arrays. The store is written to a temporary directory and swapped
+    into place on close().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = path + '.tmp'
+        if os.path.exists(self._tmp_path):
+            shutil.rmtree(self._tmp_path)
+        os.makedirs(self._tmp_path)
+        self._blob = open(os.path.join(self._tmp_path, 'texts.bin'), 'wb')
+        self._offsets = array('q', [0])
+        self._ids = array('q')
+        self._columns: Dict[str, Dict] = {}
+
+    def add(self, text: str, metadata: Dict[str, Any], chunk_id: Optional[int] = None):
+        if len(self) and (chunk_id is not None) != bool(self._ids):
+            raise ValueError("Either every chunk or no chunk must have an id")
+        if chunk_id is not None:
+            if self._ids and chunk_id <= self._ids[-1]:
+                raise ValueError("Chunk ids must be added in ascending order")
+            self._ids.append(int(chunk_id))
+        data = text.encode('utf-8')
+        self._blob.write(data)
+        row = len(self._offsets) - 1
+        self._offsets.append(self._offsets[-1] + len(data))
+
+        for name, value in metadata.items():
+            column = self._columns.get(name)
+            if column is None:
+                column = self._columns[name] = {'lookup': {}, 'values': [], 'codes': array('i', [-1]) * row}
+            key = json.dumps(value, sort_keys=True)
+            code = column['lookup'].get(key)
+            if code is None:
+                code = column['lookup'][key] = len(column['values'])
+                column['values'].append(value)
+            column['codes'].append(code)
+        for column in self._columns.values():
+            if len(column['codes']) == row:
+                column['codes'].append(-1)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def close(self):
+        self._blob.close()
+        np.save(os.path.join(self._tmp_path, 'offsets.npy'), np.frombuffer(self._offsets, dtype=np.int64).astype(np.uint64))
+        for name, column in self._columns.items():
+            np.save(os.path.join(self._tmp_path, f'col_{name}.npy'), np.frombuffer(column['codes'], dtype=np.int32))
+        if self._ids:
+            np.save(os.path.join(self._tmp_path, 'ids.npy'), np.frombuffer(self._ids, dtype=np.int64))
+        with open(os.path.join(self._tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'count': len(self),
+                'columns': {name: column['values'] for name, column in self._columns.items()},
+            }, f, ensure_ascii=False)
+
+        # Swap the finished store into place; open readers keep their mapped files
+        old_path = self.path + '.old'
+        if os.path.exists(self.path):
+            if os.path.exists(old_path):
+                shutil.rmtree(old_path)
+            os.rename(self.path, old_path)
+        os.rename(self._tmp_path, self.path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._blob.close()
+            shutil.rmtree(self._tmp_path, ignore_errors=True)
+
+
+def write_chunk_store(path: str, texts: List[str], metadatas: List[Dict[str, Any]],
+                      ids: Optional[List[int]] = None):
+    """Write a complete chunk store from in-memory lists"""
+    with ChunkStoreWriter(path) as writer:
+        for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+            writer.add(text, metadata, ids[i] if ids is not None else None)
+
+
+def update_chunk_store(path: str, removed_ids: Iterable[int],
+                       chunks: Iterable[Tuple[str, Dict[str, Any], int]]):
+    """
+    Rewrite a store without the chunks in removed_ids and with new
+    (text, metadata, id) chunks appended. Kept chunks are copied from the
+    mapped files as-is; new ids must be larger than every existing id.
+    """
+    removed = set(int(i) for i in removed_ids)
+    store = ChunkStore(path)
+    with ChunkStoreWriter(path) as writer:
+        try:
+            for row in range(len(store)):
+                chunk_id = store.chunk_id(row)
+                if chunk_id not in removed:
+                    writer.add(store.text(row), store.metadata(row), chunk_id)
+        finally:
+            store.close()
+        for text, metadata, chunk_id in chunks:
+            writer.add(text, metadata, chunk_id)
+
+
+if __name__ == "__main__":
+    # One-time migration from the legacy pickle format (only run on files you created)
+    import pickle
+
+    if len(sys.argv) != 3:
+        print("Usage: python chunk_store.py <chunks.pkl> <output_dir>")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'rb') as f:
+        chunk_data = pickle.load(f)
+    write_chunk_store(sys.argv[2], chunk_data['texts'], chunk_data['metadatas'])
+    print(f"Wrote {len(chunk_data['texts'])} chunks to {sys.argv[2]}")
@@ -0,0 +1,156 @@
+"""
+Prompt context packing
+Chunks are split with a 100-character overlap, so the top hits often include
+neighbouring chunks of the same page that repeat each other's text. The
+packer merges hits from the same page that overlap (or are adjacent chunk ids)
+into one passage, drops hits whose text is already contained in another, and
+then fills a token budget with passages in relevance order. Every passage
+comes from a single page, so its [Source p.X] citation stays correct.
+
+Token counts are estimated from characters (~4 per token for English text),
+which is close enough to budget a prompt without calling the LLM's tokenizer.
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 4
+MIN_PASSAGE_TOKENS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def page_label(metadata: Dict):
+    return metadata.get('page_label', metadata.get('page', '?'))
+
+
+def format_passage(page, text: str) -> str:
+    return f"[Source p.{page}] {text}\n\n"
+
+
+def _overlap_length(first: str, second: str, min_overlap: int) -> int:
+    """Length of the longest suffix of first that is a prefix of second (0 if shorter than min_overlap)"""
+    probe = second[:min_overlap]
+    pos = first.find(probe, max(0, len(first) - len(second) + 1))
+    while pos != -1:
+        if second.startswith(first[pos:]):
+            return len(first) - pos
+        pos = first.find(probe, pos + 1)
+    return 0
+
+
+def _combine(a: Dict, b: Dict, min_overlap: int) -> Optional[Dict]:
+    """One passage covering a and b if their texts overlap or they are consecutive chunks, else None"""
+    if b['text'] in a['text']:
+        text = a['text']
+    elif a['text'] in b['text']:
+        text = b['text']
+    else:
+        if a['first_id'] is not None and b['first_id'] is not None:
+            orders = [(a, b)] if a['first_id'] < b['first_id'] else [(b, a)]
+        else:
+            orders = [(a, b), (b, a)]
+        text = None
+        for first, second in orders:
+            length = _overlap_length(first['text'], second['text'], min_overlap)
+            if length:
+                text = first['text'] + second['text'][length:]
+                break
+            if first['last_id'] is not None and first['last_id'] + 1 == second['first_id']:
+                text = first['text'] + "\n" + second['text']
+                break
+        if text is None:
+            return None
+
+    ids = [i for i in (a['first_id'], a['last_id'], b['first_id'], b['last_id']) if i is not None]
+    return {
+        'key': a['key'],
+        'page': a['page'],
+        'text': text,
+        'rank': min(a['rank'], b['rank']),
+        'chunks': a['chunks'] + b['chunks'],
+        'first_id': min(ids) if ids else None,
+        'last_id': max(ids) if ids else None,
+    }
+
+
+def merge_hits(results: List[Dict], min_overlap: int = 20) -> List[Dict]:
+    """Merge overlapping and adjacent hits from the same page; passages keep their best rank"""
+    passages = []
+    for rank, result in enumerate(results):
+        metadata = result['metadata']
+        passage = {
+            'key': (metadata.get('source'), page_label(metadata)),
+            'page': page_label(metadata),
+            'text': result['text'].strip(),
+            'rank': rank,
+            'chunks': 1,
+            'first_id': result.get('id'),
+            'last_id': result.get('id'),
+        }
+        # A merged span can bridge two passages that didn't touch before, so repeat until stable
+        merged = True
+        while merged:
+            merged = False
+            for other in passages:
+                if other['key'] != passage['key']:
+                    continue
+                combined = _combine(other, passage, min_overlap)
+                if combined is not None:
+                    passages.remove(other)
+                    passage, merged = combined, True
+                    break
+        passages.append(passage)
+    return sorted(passages, key=lambda p: p['rank'])
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cut text to max_chars at a sentence or word boundary"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = max(cut.rfind('. '), cut.rfind('\n'))
+    if boundary < max_chars // 2:
+        boundary = cut.rfind(' ')
+    return (cut[:boundary + 1] if boundary > 0 else cut).rstrip() + " …"
+
+
+def pack_context(results: List[Dict], token_budget: int, min_overlap: int = 20) -> Tuple[str, Dict]:
+    """
+    Build the prompt context from retrieval results.
+    Returns (context, stats) where stats compares the estimated tokens with
+    the unpacked context (one block per hit).
+    """
+    tokens_before = sum(estimate_tokens(format_passage(page_label(r['metadata']), r['text'])) for r in results)
+    passages = merge_hits(results, min_overlap)
+
+    blocks, used, truncated = [], 0, 0
+    for passage in passages:
+        block = format_passage(passage['page'], passage['text'])
+        cost = estimate_tokens(block)
+        if used + cost > token_budget:
+            remaining = token_budget - used
+            # Always include something from the best passage, otherwise only worthwhile fragments
+            if remaining >= MIN_PASSAGE_TOKENS or not blocks:
+                overhead = len(format_passage(passage['page'], ""))
+                max_chars = max(remaining * CHARS_PER_TOKEN - overhead, MIN_PASSAGE_TOKENS * CHARS_PER_TOKEN)
+                block = format_passage(passage['page'], _truncate(passage['text'], max_chars))
+                blocks.append(block)
+                used += estimate_tokens(block)
+                truncated += 1
+            break
+        blocks.append(block)
+        used += cost
+
+    stats = {
+        'chunks': len(results),
+        'passages': len(blocks),
+        'merged': len(results) - len(passages),
+        'dropped': len(passages) - len(blocks),
+        'truncated': truncated,
+        'tokens_before': tokens_before,
+        'tokens_after': used,
+        'tokens_saved': max(0, tokens_before - used),
+    }
+    return "".join(blocks), stats
@@ -0,0 +1,90 @@
+"""
+Pluggable sentence embedding backends
+    torch  SentenceTransformer('all-MiniLM-L6-v2') (needs torch)
+    onnx   the same model exported to ONNX and int8-quantized (see export_onnx.py),
+           run with ONNX Runtime and the `tokenizers` package (no torch)
+
+Both expose SentenceTransformer's encode() / get_sentence_embedding_dimension(),
+so callers (the embedding cache, batcher and ingestion) don't care which one
+they get. Choose with EMBEDDING_BACKEND; the ONNX model directory is
+EMBEDDING_ONNX_PATH.
+"""
+import json
+import os
+from typing import List, Optional, Union
+
+import numpy as np
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+EMBEDDING_BACKENDS = ('torch', 'onnx')
+DEFAULT_ONNX_PATH = os.path.join('models', 'all-MiniLM-L6-v2-int8')
+ONNX_CONFIG_FILE = 'embedder_config.json'
+
+
+class OnnxEmbedder:
+    """Mean-pooled transformer embeddings on ONNX Runtime, matching SentenceTransformer.encode"""
+
+    def __init__(self, path: str, threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, ONNX_CONFIG_FILE), encoding='utf-8') as f:
+            self.config = json.load(f)
+        if self.config.get('pooling') != 'mean':
+            raise ValueError(f"Unsupported pooling mode: {self.config.get('pooling')}")
+        self.max_seq_length = self.config['max_seq_length']
+        self.normalize = self.config['normalize']
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=self.config['pad_id'], pad_token=self.config['pad_token'])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(path, self.config['model_file']), options,
+                                            providers=['CPUExecutionProvider'])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config['dimension']
+
+    def _encode_batch(self, sentences: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(sentences)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self._inputs:
+            feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        if not sentences:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Batch similar lengths together so little time is spent on padding
+        order = np.argsort([-len(s) for s in sentences], kind='stable')
+        parts = [self._encode_batch([sentences[i] for i in order[start:start + batch_size]])
+                 for start in range(0, len(sentences), batch_size)]
+        embeddings = np.concatenate(parts)[np.argsort(order)].astype(np.float32)
+        if self.normalize or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def load_embedder(backend: Optional[str] = None, onnx_path: Optional[str] = None):
+    """Create the configured embedding backend; torch is only imported for the torch backend"""
+    backend = (backend or os.getenv('EMBEDDING_BACKEND', 'torch')).strip().lower()
+    if backend == 'onnx':
+        return OnnxEmbedder(onnx_path or os.getenv('EMBEDDING_ONNX_PATH', DEFAULT_ONNX_PATH))
+    if backend == 'torch':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDING_MODEL, device='cpu')
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose from: {', '.join(EMBEDDING_BACKENDS)}")
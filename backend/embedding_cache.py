@@ -0,0 +1,96 @@
+"""
+Bounded, thread-safe LRU cache for query embeddings
+Shared by the FastAPI backend, the Gradio app and rag_qa.py so repeated
+questions skip the embedding model's forward pass.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different phrasings share a cache entry"""
+    return " ".join(query.lower().split()).strip(" ?!.")
+
+
+class EmbeddingCache:
+    """LRU cache mapping normalized query text to its embedding"""
+
+    def __init__(self, maxsize: int = 2048):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return the cached embedding for a normalized key, or None"""
+        with self._lock:
+            emb = self._entries.get(key)
+            if emb is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return emb
+
+    def put(self, key: str, emb: np.ndarray):
+        """Store an embedding, evicting the least recently used entry if full"""
+        emb = np.ascontiguousarray(emb, dtype=np.float32)
+        emb.setflags(write=False)
+        with self._lock:
+            self._entries[key] = emb
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def encode(self, embedder, query: str) -> np.ndarray:
+        """Return a (1, dim) float32 embedding for query, encoding only on a miss"""
+        key = normalize_query(query)
+        emb = self.get(key)
+        if emb is None:
+            # Encode outside the lock; a concurrent duplicate miss just recomputes
+            emb = embedder.encode([query], convert_to_numpy=True)
+            self.put(key, emb)
+        return emb
+
+    def encode_many(self, embedder, queries: List[str]) -> np.ndarray:
+        """Return an (n, dim) array of embeddings, encoding all misses in one batch"""
+        keys = [normalize_query(q) for q in queries]
+        cached = [self.get(key) for key in keys]
+        missing = [i for i, emb in enumerate(cached) if emb is None]
+        if missing:
+            fresh = embedder.encode([queries[i] for i in missing], convert_to_numpy=True)
+            for i, emb in zip(missing, fresh):
+                cached[i] = emb.reshape(1, -1)
+                self.put(keys[i], cached[i])
+        return np.vstack(cached).astype(np.float32, copy=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Process-wide cache used by all entry points
+embedding_cache = EmbeddingCache(maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")))
@@ -0,0 +1,170 @@
+"""
+Export the embedding model to int8-quantized ONNX and check retrieval parity
+Needs torch, sentence-transformers, onnx and onnxruntime, so run it once on a
+build machine; the API then only needs onnxruntime and tokenizers
+(EMBEDDING_BACKEND=onnx).
+
+The parity check embeds sample questions and chunk texts with both backends
+and compares the vectors (cosine) and the FAISS results (top-k overlap).
+
+Usage:
+    python export_onnx.py                      # export to models/all-MiniLM-L6-v2-int8, then check parity
+    python export_onnx.py --no-quantize        # keep float32 weights
+    python export_onnx.py --check-only         # re-check an existing export
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+
+import numpy as np
+
+from embedders import DEFAULT_ONNX_PATH, EMBEDDING_MODEL, ONNX_CONFIG_FILE, OnnxEmbedder
+
+SAMPLE_QUERIES = [
+    "What are the main pests affecting cotton crops?",
+    "How to control pink bollworm in cotton?",
+    "What is the recommended dosage for whitefly control?",
+    "How to manage cotton leaf curl disease?",
+    "Which insecticides are effective against jassids?",
+    "Profenophos 50 EC dose per acre",
+    "When should pheromone traps be installed?",
+    "How do I identify mealybug infestation?",
+    "What causes boll rot and how is it treated?",
+    "Economic threshold level for aphids in cotton",
+]
+
+
+def export(output: str, model_name: str = EMBEDDING_MODEL, quantize: bool = True, opset: int = 17):
+    """Export the SentenceTransformer's transformer to ONNX with tokenizer and pooling config"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    pooling_config = model[1].get_config_dict()
+    pooling = pooling_config.get('pooling_mode') or model[1].get_pooling_mode_str()
+    if pooling != 'mean':
+        raise ValueError(f"Only mean pooling is supported, model uses '{pooling}'")
+    tokenizer = model.tokenizer
+    sample = tokenizer(SAMPLE_QUERIES[:2], padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs))).last_hidden_state
+
+    os.makedirs(output, exist_ok=True)
+    fp32_path = os.path.join(output, 'model_fp32.onnx')
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(model[0].auto_model.eval()),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            **export_kwargs,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        model_file = 'model_int8.onnx'
+        quantize_dynamic(fp32_path, os.path.join(output, model_file), weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    else:
+        model_file = 'model_fp32.onnx'
+
+    tokenizer.backend_tokenizer.save(os.path.join(output, 'tokenizer.json'))
+    config = {
+        'model': model_name,
+        'model_file': model_file,
+        'quantized': quantize,
+        'dimension': model.get_sentence_embedding_dimension(),
+        'max_seq_length': model.max_seq_length,
+        'pooling': pooling,
+        'normalize': any(type(module).__name__ == 'Normalize' for module in model),
+        'pad_id': tokenizer.pad_token_id,
+        'pad_token': tokenizer.pad_token,
+    }
+    with open(os.path.join(output, ONNX_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    return model, config
+
+
+def parity_queries(store_path: str = 'chunk_store', n_chunks: int = 100):
+    """Sample questions plus chunk texts, which exercise long, truncated inputs"""
+    queries = list(SAMPLE_QUERIES)
+    if os.path.exists(store_path):
+        from chunk_store import ChunkStore
+        store = ChunkStore(store_path)
+        rows = np.random.default_rng(0).choice(len(store), size=min(n_chunks, len(store)), replace=False)
+        queries.extend(store.text(row) for row in sorted(rows))
+        store.close()
+    return queries
+
+
+def check_parity(reference, candidate, queries, index_path: str = 'faiss_index.bin', k: int = 5):
+    """Compare two embedders on the same queries: vector cosine and FAISS top-k agreement"""
+    ref = np.asarray(reference.encode(queries, convert_to_numpy=True), dtype=np.float32)
+    cand = np.asarray(candidate.encode(queries, convert_to_numpy=True), dtype=np.float32)
+    cosine = np.sum(ref * cand, axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(cand, axis=1))
+    report = {
+        'queries': len(queries),
+        'cosine_mean': round(float(cosine.mean()), 5),
+        'cosine_min': round(float(cosine.min()), 5),
+    }
+    if os.path.exists(index_path):
+        from vector_index import load_index
+        index, _ = load_index(index_path)
+        _, ref_ids = index.search(ref, k)
+        _, cand_ids = index.search(cand, k)
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_ids, cand_ids)]
+        report[f'overlap@{k}'] = round(float(np.mean(overlap)), 4)
+        report['top1_agreement'] = round(float(np.mean(ref_ids[:, 0] == cand_ids[:, 0])), 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to quantized ONNX and check parity")
+    parser.add_argument('--output', default=DEFAULT_ONNX_PATH)
+    parser.add_argument('--model', default=EMBEDDING_MODEL)
+    parser.add_argument('--no-quantize', action='store_true', help="Keep float32 weights")
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--check-only', action='store_true', help="Skip the export and only check parity")
+    parser.add_argument('--index', default='faiss_index.bin')
+    parser.add_argument('--store', default='chunk_store')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--min-cosine', type=float, default=0.98, help="Fail if mean cosine is lower")
+    parser.add_argument('--min-overlap', type=float, default=0.9, help="Fail if mean top-k overlap is lower")
+    args = parser.parse_args()
+
+    if args.check_only:
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(args.model, device='cpu')
+    else:
+        reference, config = export(args.output, args.model, quantize=not args.no_quantize, opset=args.opset)
+        print(f"✓ Exported {config['model_file']} to {args.output}")
+
+    report = check_parity(reference, OnnxEmbedder(args.output), parity_queries(args.store),
+                          index_path=args.index, k=args.k)
+    print(json.dumps(report, indent=2))
+
+    overlap = report.get(f'overlap@{args.k}')
+    if report['cosine_mean'] < args.min_cosine or (overlap is not None and overlap < args.min_overlap):
+        print("❌ ONNX embeddings diverge from the torch model; keep EMBEDDING_BACKEND=torch")
+        sys.exit(1)
+    print("✓ Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Extractive fast-path answers
+Builds a cited answer directly from the retrieved chunks, without the LLM,
+for when it is slow, rate-limited or down, or when a client asks for speed.
+
+There are no sentence-level vectors (the index holds one, possibly compressed,
+vector per chunk), so sentences are scored by reusing the retrieval result:
+the rank of their chunk against the query embedding, plus how much of the
+query they cover, with terms that are rare among the candidates weighted
+higher. No model is called; an answer takes well under a millisecond.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+from bm25_index import tokenize
+from context_packer import page_label
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n\s*\n|\s*[•▪●]\s*")
+MIN_SENTENCE_CHARS = 25
+MAX_SENTENCE_CHARS = 350
+# Weight of the chunk's retrieval rank relative to query-term coverage (0..1)
+RANK_WEIGHT = 0.35
+STOPWORDS = {
+    "the", "and", "for", "are", "was", "what", "which", "when", "how", "why", "does", "can", "should",
+    "with", "from", "about", "this", "that", "these", "those", "their", "its", "any", "all", "into",
+    "cotton", "crop", "crops",
+}
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    parts = SENTENCE_SPLIT.split(text)
+    for i, part in enumerate(parts):
+        sentence = " ".join(part.strip(" -*").split())
+        # Chunk boundaries fall mid-sentence: skip a leading fragment and an unfinished tail
+        if i == 0 and sentence[:1].islower():
+            continue
+        if i == len(parts) - 1 and i > 0 and not sentence.endswith((".", "!", "?", ";", ")")):
+            continue
+        if MIN_SENTENCE_CHARS <= len(sentence) <= MAX_SENTENCE_CHARS:
+            sentences.append(sentence)
+    return sentences
+
+
+def _terms(text: str) -> set:
+    return {t for t in tokenize(text) if len(t) > 2 and t not in STOPWORDS}
+
+
+def rank_sentences(query: str, results: List[Dict]) -> List[Dict]:
+    """Candidate sentences of the retrieved chunks, best first"""
+    candidates = []
+    for rank, r in enumerate(results):
+        for position, sentence in enumerate(split_sentences(r['text'])):
+            candidates.append({'text': sentence, 'terms': _terms(sentence), 'rank': rank,
+                               'position': position, 'page': page_label(r['metadata'])})
+    if not candidates:
+        return []
+
+    query_terms = _terms(query)
+    document_freq = Counter(term for c in candidates for term in c['terms'] & query_terms)
+    idf = {term: math.log(1 + len(candidates) / (1 + document_freq[term])) for term in query_terms}
+    total = sum(idf.values()) or 1.0
+    for c in candidates:
+        coverage = sum(idf[term] for term in c['terms'] & query_terms) / total
+        c['score'] = (1 - RANK_WEIGHT) * coverage + RANK_WEIGHT / (1 + c['rank'])
+    return sorted(candidates, key=lambda c: (-c['score'], c['rank'], c['position']))
+
+
+def extractive_answer(query: str, results: List[Dict], heading: str, max_sentences: int = 4,
+                      max_chars: int = 900) -> Optional[str]:
+    """
+    Answer from the best-matching sentences of the retrieved chunks, each with
+    a [Source p.X] citation. None if no chunk has a usable sentence.
+    """
+    picked, seen, length = [], set(), 0
+    for c in rank_sentences(query, results):
+        key = c['text'].lower()
+        if key in seen or length + len(c['text']) > max_chars:
+            continue
+        seen.add(key)
+        picked.append(c)
+        length += len(c['text'])
+        if len(picked) == max_sentences:
+            break
+    if not picked:
+        return None
+    lines = [heading, ""] + [f"- {c['text']} [Source p.{c['page']}]" for c in picked]
+    return "\n".join(lines)
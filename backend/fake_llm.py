@@ -0,0 +1,131 @@
+"""
+Local stand-in for the Gemini GenerativeModel
+Lets the API (including the streaming endpoint) run without network access or quota.
+Enable with LLM_BACKEND=fake.
+
+Failures can be injected to exercise retries and the circuit breaker:
+FAKE_LLM_429_RATE and FAKE_LLM_5XX_RATE are the fractions of calls that fail
+with a rate-limit or server error, and FAKE_LLM_JITTER_MS adds random latency.
+
+Latency to the first token follows FAKE_LLM_LATENCY_DIST: "fixed" (the default,
+FAKE_LLM_LATENCY_MS plus uniform jitter) or "lognormal" (median
+FAKE_LLM_LATENCY_MS with shape FAKE_LLM_LATENCY_SIGMA, giving the long tail of
+a real API; 0.5 puts p99 at about 3x the median).
+"""
+import asyncio
+import os
+import random
+import re
+import time
+from typing import AsyncIterator, List
+
+LATENCY_DISTRIBUTIONS = ("fixed", "lognormal")
+
+
+class FakeAPIError(Exception):
+    """Mimics google.api_core errors, which carry the HTTP status in `.code`"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeChunk:
+    """Mimics a streamed response chunk / full response from google.generativeai"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeStream:
+    """Async iterator over answer chunks, emitted at a fixed token rate"""
+
+    def __init__(self, tokens: List[str], first_token_delay: float, token_delay: float):
+        self._tokens = tokens
+        self._first_token_delay = first_token_delay
+        self._token_delay = token_delay
+        self.closed = False
+
+    async def __aiter__(self) -> AsyncIterator[FakeChunk]:
+        await asyncio.sleep(self._first_token_delay)
+        for i, token in enumerate(self._tokens):
+            if self.closed:
+                return
+            if i:
+                await asyncio.sleep(self._token_delay)
+            yield FakeChunk(token)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel with configurable latency and token rate"""
+
+    def __init__(self, latency_ms: float = None, tokens_per_sec: float = None, jitter_ms: float = None,
+                 rate_429: float = None, rate_5xx: float = None, seed: int = None,
+                 latency_dist: str = None, latency_sigma: float = None):
+        self.latency = (latency_ms if latency_ms is not None
+                        else float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))) / 1000
+        self.tokens_per_sec = (tokens_per_sec if tokens_per_sec is not None
+                               else float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50")))
+        self.jitter = (jitter_ms if jitter_ms is not None
+                       else float(os.getenv("FAKE_LLM_JITTER_MS", "0"))) / 1000
+        self.rate_429 = rate_429 if rate_429 is not None else float(os.getenv("FAKE_LLM_429_RATE", "0"))
+        self.rate_5xx = rate_5xx if rate_5xx is not None else float(os.getenv("FAKE_LLM_5XX_RATE", "0"))
+        self.latency_dist = latency_dist or os.getenv("FAKE_LLM_LATENCY_DIST", "fixed")
+        if self.latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown FAKE_LLM_LATENCY_DIST '{self.latency_dist}', "
+                             f"expected one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.latency_sigma = (latency_sigma if latency_sigma is not None
+                              else float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5")))
+        self._random = random.Random(seed)
+
+    def _delay(self) -> float:
+        latency = self.latency
+        if self.latency_dist == "lognormal":
+            latency *= self._random.lognormvariate(0, self.latency_sigma)
+        return latency + self._random.uniform(0, self.jitter)
+
+    def _injected_error(self):
+        """An injected 429 or 5xx error at the configured rates, or None"""
+        roll = self._random.random()
+        if roll < self.rate_429:
+            return FakeAPIError(429, "Resource has been exhausted (e.g. check quota).")
+        if roll < self.rate_429 + self.rate_5xx:
+            return FakeAPIError(503, "The service is currently unavailable.")
+        return None
+
+    def _answer_for(self, prompt: str) -> str:
+        """Produce a deterministic answer that cites the pages found in the prompt"""
+        context = prompt.split("Context:", 1)[-1]
+        pages = list(dict.fromkeys(re.findall(r"\[Source p\.([^\]]+)\]", context)))[:3] or ["?"]
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        lines = [f"Based on the ICAR-CICR advisory, here is guidance on: {question}"]
+        for page in pages:
+            lines.append(f"- Follow the recommended practices described in the advisory [Source p.{page}]")
+        return "\n".join(lines)
+
+    def _tokens(self, text: str) -> List[str]:
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeChunk:
+        error = self._injected_error()
+        if error:
+            raise error
+        text = self._answer_for(prompt)
+        time.sleep(self._delay() + len(self._tokens(text)) / self.tokens_per_sec)
+        return FakeChunk(text)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        text = self._answer_for(prompt)
+        tokens = self._tokens(text)
+        error = self._injected_error()
+        if error:
+            # Errors arrive after part of the latency, like a real server's
+            await asyncio.sleep(self._delay() / 2)
+            raise error
+        if stream:
+            return FakeStream(tokens, self._delay(), 1 / self.tokens_per_sec)
+        await asyncio.sleep(self._delay() + len(tokens) / self.tokens_per_sec)
+        return FakeChunk(text)
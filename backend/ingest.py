@@ -0,0 +1,355 @@
+"""
+Incremental ingestion manifest
+Records every ingested source file with its content hash and the chunk ids
+it produced. Comparing the manifest with the files on disk tells
+chunk_and_embed.py which documents are new, changed or gone. Only those are
+chunked and embedded; their old chunk ids are removed from the index and
+chunk store, and unchanged chunks are left alone.
+
+Manifest layout (ingest_manifest.json):
+    version         format version
+    settings        chunking and embedding settings the vectors were made with;
+                    any change forces a full re-embed
+    index_settings  index type, encoding and PCA size the index was built with;
+                    a change rebuilds the index from the stored vectors
+    next_id         next unused chunk id (ids are never reused)
+    files           {path: {sha256, size, mtime_ns, chunk_ids}}
+
+A build in progress is checkpointed to ingest_checkpoint/ (see IngestCheckpoint),
+so an interrupted run resumes where it stopped instead of re-embedding. The
+vectors of every indexed chunk are kept in ingest_vectors/ (see VectorStore).
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+
+
+class IngestPlan(NamedTuple):
+    """Differences between the manifest and the current source files"""
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+    unchanged: List[str]
+
+    @property
+    def to_ingest(self) -> List[str]:
+        return self.added + self.changed
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+def new_manifest(settings: Dict) -> Dict:
+    return {'version': MANIFEST_VERSION, 'settings': settings, 'next_id': 0, 'files': {}}
+
+
+def load_manifest(path: str, settings: Dict) -> Dict:
+    """Load the manifest; a missing, old-format or differently configured one starts empty"""
+    if not os.path.exists(path):
+        return new_manifest(settings)
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('settings') != settings:
+        return new_manifest(settings)
+    return manifest
+
+
+def save_manifest(manifest: Dict, path: str):
+    """Write the manifest atomically so an interrupted run keeps the previous one"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_sources(paths: Iterable[str], extensions=('.pdf',)) -> List[str]:
+    """Expand files and directories into a sorted list of source documents"""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                sources.extend(os.path.join(root, name) for name in files
+                               if name.lower().endswith(extensions))
+        elif os.path.exists(path):
+            sources.append(path)
+        else:
+            raise FileNotFoundError(f"Source not found: {path}")
+    return sorted(os.path.normpath(source) for source in sources)
+
+
+def plan_changes(manifest: Dict, sources: List[str]) -> IngestPlan:
+    """
+    Classify sources against the manifest. Files whose size and mtime match
+    the manifest are assumed unchanged; others are hashed, so a touched but
+    identical file is not re-ingested.
+    """
+    files = manifest['files']
+    added, changed, unchanged = [], [], []
+    for source in sources:
+        entry = files.get(source)
+        if entry is None:
+            added.append(source)
+            continue
+        stat = os.stat(source)
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+            unchanged.append(source)
+        elif file_sha256(source) == entry['sha256']:
+            entry['mtime_ns'] = stat.st_mtime_ns
+            unchanged.append(source)
+        else:
+            changed.append(source)
+    removed = sorted(set(files) - set(sources))
+    return IngestPlan(added, changed, removed, unchanged)
+
+
+def record_file(manifest: Dict, source: str, chunk_ids: List[int]):
+    stat = os.stat(source)
+    manifest['files'][source] = {
+        'sha256': file_sha256(source),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'chunk_ids': chunk_ids,
+    }
+
+
+def stale_ids(manifest: Dict, plan: IngestPlan) -> List[int]:
+    """Chunk ids of changed and removed files, to delete from the index and store"""
+    return [chunk_id for source in plan.changed + plan.removed
+            for chunk_id in manifest['files'][source]['chunk_ids']]
+
+
+class IngestCheckpoint:
+    """
+    Durable progress of a streaming build.
+    Embedded vectors, their chunk ids and the chunk texts are appended to logs
+    as batches finish; state.json records how much of each log is committed,
+    which documents are complete and how far the current document got. On
+    resume the logs are truncated to the committed length, so a crash between
+    commits only loses the work done since the last one.
+
+    Files:
+        state.json     plan of the build and committed progress
+        vectors.f32    float32[rows, dimension] embeddings, in chunk id order
+        ids.i64        int64[rows] chunk ids
+        chunks.jsonl   one {"id", "text", "metadata"} line per chunk
+    """
+
+    def __init__(self, path: str, state: Dict):
+        self.path = path
+        self.state = state
+        self._truncate_logs()
+        self._vectors = open(self._file('vectors.f32'), 'ab')
+        self._ids = open(self._file('ids.i64'), 'ab')
+        self._chunks = open(self._file('chunks.jsonl'), 'ab')
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _truncate_logs(self):
+        rows = self.state['rows']
+        dim = self.state['dimension'] or 0
+        for name, size in (('vectors.f32', rows * dim * 4), ('ids.i64', rows * 8),
+                           ('chunks.jsonl', self.state['chunks_bytes'])):
+            with open(self._file(name), 'ab') as f:
+                f.truncate(size)
+
+    @classmethod
+    def start(cls, path: str, settings: Dict, plan: Dict, next_id: int) -> "IngestCheckpoint":
+        """Begin a new build; plan holds what to ingest and remove"""
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        state = {
+            'version': MANIFEST_VERSION,
+            'settings': settings,
+            'plan': plan,
+            'next_id': next_id,
+            'dimension': None,
+            'rows': 0,
+            'chunks_bytes': 0,
+            'done': {},
+            'partial': None,
+        }
+        checkpoint = cls(path, state)
+        checkpoint._write_state()
+        return checkpoint
+
+    @classmethod
+    def resume(cls, path: str, settings: Dict) -> Optional["IngestCheckpoint"]:
+        """Reopen an interrupted build with the same settings, or return None"""
+        state_path = os.path.join(path, 'state.json')
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('version') != MANIFEST_VERSION or state.get('settings') != settings:
+            return None
+        return cls(path, state)
+
+    @property
+    def rows(self) -> int:
+        return self.state['rows']
+
+    def allocate_ids(self, count: int) -> int:
+        """Reserve count consecutive chunk ids and return the first"""
+        start = self.state['next_id']
+        self.state['next_id'] = start + count
+        return start
+
+    def append(self, vectors: np.ndarray, ids: List[int], chunks: List[Tuple[str, Dict[str, Any]]]):
+        """Append a batch of embedded chunks (committed by the next commit())"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.state['dimension'] is None:
+            self.state['dimension'] = int(vectors.shape[1])
+        self._vectors.write(vectors.tobytes())
+        self._ids.write(np.asarray(ids, dtype=np.int64).tobytes())
+        for chunk_id, (text, metadata) in zip(ids, chunks):
+            line = json.dumps({'id': int(chunk_id), 'text': text, 'metadata': metadata}, ensure_ascii=False)
+            self._chunks.write(line.encode('utf-8') + b'\n')
+        self.state['rows'] += len(ids)
+
+    def commit(self, done: Dict[str, List[int]], partial: Optional[Dict]):
+        """
+        Make everything appended so far durable.
+        done maps finished documents to [first_id, count]; partial describes the
+        document in progress as {source, start, count, written}.
+        """
+        for f in (self._vectors, self._ids, self._chunks):
+            f.flush()
+            os.fsync(f.fileno())
+        self.state['chunks_bytes'] = self._chunks.tell()
+        self.state['done'] = done
+        self.state['partial'] = partial
+        self._write_state()
+
+    def _write_state(self):
+        tmp_path = self._file('state.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self._file('state.json'))
+
+    def vectors(self) -> np.ndarray:
+        """Committed embeddings as a read-only memory map"""
+        dim = self.state['dimension']
+        if not self.rows:
+            return np.zeros((0, dim or 0), dtype=np.float32)
+        return np.memmap(self._file('vectors.f32'), dtype=np.float32, mode='r', shape=(self.rows, dim))
+
+    def ids(self) -> np.ndarray:
+        if not self.rows:
+            return np.zeros(0, dtype=np.int64)
+        return np.memmap(self._file('ids.i64'), dtype=np.int64, mode='r', shape=(self.rows,))
+
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Committed (vectors, ids) in batches, for replaying into an index"""
+        vectors, ids = self.vectors(), self.ids()
+        for start in range(0, self.rows, batch_size):
+            yield np.array(vectors[start:start + batch_size]), np.array(ids[start:start + batch_size])
+
+    def iter_chunks(self) -> Iterator[Tuple[str, Dict[str, Any], int]]:
+        """Committed chunks as (text, metadata, id)"""
+        with open(self._file('chunks.jsonl'), 'rb') as f:
+            remaining = self.state['chunks_bytes']
+            for line in f:
+                remaining -= len(line)
+                if remaining < 0:
+                    break
+                chunk = json.loads(line)
+                yield chunk['text'], chunk['metadata'], chunk['id']
+
+    def close(self):
+        for f in (self._vectors, self._ids, self._chunks):
+            f.close()
+
+    def discard(self):
+        """Remove the checkpoint once its build has been published"""
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class VectorStore:
+    """
+    Float32 embeddings of every indexed chunk, kept between runs.
+    The index may store them compressed or projected, so a change of index
+    type, encoding or PCA size is rebuilt from these instead of re-embedding
+    the documents. Same logs as the checkpoint (vectors.f32, ids.i64, ids
+    ascending) plus meta.json with the row count and dimension.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.rows, self.dimension = meta['rows'], meta['dimension']
+
+    @classmethod
+    def open(cls, path: str) -> Optional["VectorStore"]:
+        """The store at path, or None if there is none"""
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+        return cls(path)
+
+    def vectors(self) -> np.ndarray:
+        if not self.rows:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        return np.memmap(os.path.join(self.path, 'vectors.f32'), dtype=np.float32, mode='r',
+                         shape=(self.rows, self.dimension))
+
+    def ids(self) -> np.ndarray:
+        if not self.rows:
+            return np.zeros(0, dtype=np.int64)
+        return np.memmap(os.path.join(self.path, 'ids.i64'), dtype=np.int64, mode='r', shape=(self.rows,))
+
+    def iter_batches(self, batch_size: int, removed_ids: Iterable[int] = ()) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Stored (vectors, ids) in batches, skipping removed_ids"""
+        removed = np.fromiter((int(i) for i in removed_ids), dtype=np.int64)
+        vectors, ids = self.vectors(), self.ids()
+        for start in range(0, self.rows, batch_size):
+            batch_vectors = np.array(vectors[start:start + batch_size])
+            batch_ids = np.array(ids[start:start + batch_size])
+            if len(removed):
+                kept = ~np.isin(batch_ids, removed)
+                batch_vectors, batch_ids = batch_vectors[kept], batch_ids[kept]
+            if len(batch_ids):
+                yield batch_vectors, batch_ids
+
+    @staticmethod
+    def write(path: str, batches: Iterable[Tuple[np.ndarray, np.ndarray]]):
+        """
+        Write a store from (vectors, ids) batches in ascending id order. The
+        batches may be read from the store being replaced; it is swapped in
+        only once complete.
+        """
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        rows, dimension = 0, None
+        with open(os.path.join(tmp_path, 'vectors.f32'), 'wb') as vectors_file, \
+                open(os.path.join(tmp_path, 'ids.i64'), 'wb') as ids_file:
+            for vectors, ids in batches:
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                dimension = int(vectors.shape[1])
+                vectors_file.write(vectors.tobytes())
+                ids_file.write(np.asarray(ids, dtype=np.int64).tobytes())
+                rows += len(ids)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'rows': rows, 'dimension': dimension}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
@@ -0,0 +1,227 @@
+"""
+Resilient LLM client
+Wraps one shared GenerativeModel (whose connection is reused across calls)
+with the protections every call needs:
+    - a global concurrency limit sized to the API quota
+    - a timeout per call (for streams: until the first chunk, then between chunks)
+    - retries with full-jitter exponential backoff, only for transient errors
+      (429, 5xx, timeouts, connection errors) and never after a stream has
+      started emitting text
+    - a circuit breaker: after `failure_threshold` consecutive transient
+      failures calls fail fast with CircuitOpenError for `reset_timeout`
+      seconds, then a single trial call decides whether to close it again
+"""
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Dict, Optional
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the LLM while the circuit breaker is open"""
+
+
+class LLMTimeoutError(TimeoutError):
+    """The LLM did not respond within the per-call timeout"""
+
+
+def status_code(e: Exception) -> Optional[int]:
+    """HTTP status of an API error (google.api_core exceptions and the fake LLM's carry `.code`)"""
+    code = getattr(e, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(e: Exception) -> bool:
+    code = status_code(e)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    return isinstance(e, (TimeoutError, asyncio.TimeoutError, ConnectionError))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open trial call"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return
+        self.rejected += 1
+        retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"LLM circuit open after {self.failures} consecutive failures; "
+                               f"service unavailable, retrying in {retry_in:.0f}s")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial_in_flight:
+                self.opens += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def release(self):
+        """A call ended without telling whether the service is healthy (e.g. a bad request)"""
+        self.trial_in_flight = False
+
+
+class LLMClient:
+    """Concurrency-limited, retrying, circuit-broken access to a GenerativeModel"""
+
+    def __init__(self, model, max_concurrency: int = 8, timeout: float = 30.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max, base * 2**attempt)]"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _attempts(self):
+        """Yield attempt numbers, sleeping with backoff between them"""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self.backoff(attempt - 1))
+            yield attempt
+
+    def _failed(self, e: Exception, attempt: int) -> bool:
+        """Record a failed attempt; True if it should be retried"""
+        if isinstance(e, LLMTimeoutError):
+            self.timeouts += 1
+        if not is_retryable(e):
+            self.breaker.release()
+            return False
+        self.breaker.record_failure()
+        return attempt < self.max_retries
+
+    async def _with_timeout(self, awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, self.timeout)
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"LLM timeout after {self.timeout:g}s") from None
+
+    async def generate(self, prompt: str) -> str:
+        """Generate a complete answer, retrying transient failures"""
+        self.calls += 1
+        async for attempt in self._attempts():
+            self.breaker.before_call()
+            try:
+                async with self.semaphore:
+                    response = await self._with_timeout(self.model.generate_content_async(prompt))
+                text = response.text
+            except Exception as e:
+                if self._failed(e, attempt):
+                    continue
+                self.failures += 1
+                raise
+            except BaseException:
+                self.breaker.release()  # cancelled: don't leave a half-open trial pending
+                raise
+            self.breaker.record_success()
+            return text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Stream answer text. Failures before the first chunk are retried; once
+        text has been emitted an error is raised to the caller instead.
+        """
+        self.calls += 1
+        async for attempt in self._attempts():
+            self.breaker.before_call()
+            await self.semaphore.acquire()
+            response, chunks = None, None
+            try:
+                response = await self._with_timeout(self.model.generate_content_async(prompt, stream=True))
+                chunks = response.__aiter__()
+                first = await self._with_timeout(chunks.__anext__())
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                self.semaphore.release()
+                await _close(chunks, response)
+                if self._failed(e, attempt):
+                    continue
+                self.failures += 1
+                raise
+            except BaseException:
+                self.semaphore.release()
+                self.breaker.release()
+                raise
+            break
+
+        self.breaker.record_success()
+        try:
+            chunk = first
+            while chunk is not None:
+                if chunk.text:
+                    yield chunk.text
+                try:
+                    chunk = await self._with_timeout(chunks.__anext__())
+                except StopAsyncIteration:
+                    chunk = None
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            self.failures += 1
+            raise
+        finally:
+            self.semaphore.release()
+            await _close(chunks, response)
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "circuit_state": self.breaker.state,
+            "circuit_opens": self.breaker.opens,
+            "circuit_rejections": self.breaker.rejected,
+        }
+
+
+async def _close(chunks, response):
+    """Close a (possibly partially consumed) response stream"""
+    for obj in (chunks, response):
+        if obj is not None and hasattr(obj, "aclose"):
+            try:
+                await obj.aclose()
+            except Exception:
+                pass
@@ -0,0 +1,319 @@
+"""
+Load test for the chat API
+Drives /api/chat or /api/chat/stream of a running backend over HTTP and reports
+latency percentiles, throughput, error rates and where throughput saturates.
+Start the backend with the local fake LLM so no Gemini quota is used:
+
+    LLM_BACKEND=fake FAKE_LLM_LATENCY_DIST=lognormal FAKE_LLM_5XX_RATE=0.02 uvicorn main:app --port 8000
+
+Usage:
+    python loadtest.py --concurrency 1 2 4 8 16 32 --duration 20
+    python loadtest.py --rate 2 5 10 --duration 30 --endpoint stream
+    python loadtest.py --replay requests.log.jsonl --speed 2 --output replay.json
+
+Modes:
+    --concurrency N [N ...]   closed loop: N clients, each sending its next request as soon as
+                              the previous one finishes; several values run one after another
+    --rate R [R ...]          open loop: Poisson arrivals at R requests/s, however slowly the
+                              server answers
+    --replay FILE             requests captured with REQUEST_LOG_PATH, at their recorded spacing
+                              (divided by --speed), keeping each recorded conversation in one session
+
+Questions are TEST_QUESTIONS from test_rag.py. To measure the full pipeline on
+every request, run the server with ANSWER_CACHE_ENABLED=false and
+COALESCE_REQUESTS=false.
+
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bench_retrieval import load_test_questions
+
+ENDPOINTS = {"chat": "/api/chat", "stream": "/api/chat/stream"}
+
+
+class Recorder:
+    """Outcome and latency of every request in one load level"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.outcomes: Counter = Counter()
+
+    def add(self, outcome: str, latency: float, first_token: Optional[float] = None):
+        self.outcomes[outcome] += 1
+        if outcome == "ok":
+            self.latencies.append(latency)
+            if first_token is not None:
+                self.first_token.append(first_token)
+
+    def summary(self, wall_seconds: float) -> Dict:
+        total = sum(self.outcomes.values())
+        ok = self.outcomes["ok"]
+
+        def pct(values, q):
+            return round(float(np.percentile(values, q)) * 1000, 1) if values else None
+
+        return {
+            "requests": total,
+            "ok": ok,
+            "errors": {kind: n for kind, n in self.outcomes.items() if kind != "ok"},
+            "error_rate": round(1 - ok / total, 4) if total else None,
+            "throughput_rps": round(ok / wall_seconds, 2) if wall_seconds else None,
+            "wall_seconds": round(wall_seconds, 2),
+            "p50_ms": pct(self.latencies, 50),
+            "p95_ms": pct(self.latencies, 95),
+            "p99_ms": pct(self.latencies, 99),
+            "first_token_p50_ms": pct(self.first_token, 50),
+            "first_token_p95_ms": pct(self.first_token, 95),
+        }
+
+
+async def send(client, endpoint: str, body: Dict, recorder: Recorder) -> Optional[str]:
+    """Send one request, record its outcome and return the session id the server assigned"""
+    start = time.perf_counter()
+    first_token, session_id = None, None
+    try:
+        if endpoint == "chat":
+            response = await client.post(ENDPOINTS[endpoint], json=body)
+            if response.status_code != 200:
+                recorder.add(f"http_{response.status_code}", 0)
+                return None
+            data = response.json()
+            session_id = data.get("session_id")
+            outcome = "ok" if data.get("success") else "answer_failed"
+        else:
+            outcome = "incomplete_stream"
+            async with client.stream("POST", ENDPOINTS[endpoint], json=body) as response:
+                if response.status_code != 200:
+                    recorder.add(f"http_{response.status_code}", 0)
+                    return None
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: "):
+                        if event == "token" and first_token is None:
+                            first_token = time.perf_counter() - start
+                        elif event == "session":
+                            session_id = json.loads(line[6:]).get("session_id")
+                        elif event == "error":
+                            outcome = "stream_error"
+                        elif event == "done":
+                            outcome = "ok"
+    except Exception as e:
+        import httpx
+        if isinstance(e, httpx.TimeoutException):
+            outcome = "timeout"
+        elif isinstance(e, httpx.TransportError):
+            outcome = "connection_error"
+        else:
+            outcome = type(e).__name__
+    recorder.add(outcome, time.perf_counter() - start, first_token)
+    return session_id
+
+
+async def closed_loop(client, endpoint: str, questions: List[str], concurrency: int,
+                      duration: float, max_requests: Optional[int]) -> Dict:
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    sent = 0
+
+    async def user():
+        nonlocal sent
+        while time.perf_counter() < deadline and (max_requests is None or sent < max_requests):
+            question = questions[sent % len(questions)]
+            sent += 1
+            await send(client, endpoint, {"message": question}, recorder)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return recorder.summary(time.perf_counter() - start)
+
+
+async def open_loop(client, endpoint: str, questions: List[str], rate: float,
+                    duration: float, max_requests: Optional[int], seed: int) -> Dict:
+    recorder = Recorder()
+    rng = random.Random(seed)
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival < start + duration and (max_requests is None or len(tasks) < max_requests):
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        question = questions[len(tasks) % len(questions)]
+        tasks.append(asyncio.create_task(send(client, endpoint, {"message": question}, recorder)))
+        next_arrival += rng.expovariate(rate)
+    offered = len(tasks) / (time.perf_counter() - start)
+    await asyncio.gather(*tasks)
+    return {**recorder.summary(time.perf_counter() - start), "offered_rps": round(offered, 2)}
+
+
+def load_request_log(path: str) -> List[Dict]:
+    """Records written by the backend with REQUEST_LOG_PATH, oldest first"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"⚠️ Skipping malformed line {line_no}")
+                continue
+            if record.get("message"):
+                records.append(record)
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+async def replay(client, records: List[Dict], speed: float, endpoint_override: Optional[str]) -> Dict:
+    recorder = Recorder()
+    # Recorded session id -> session id on the server under test
+    sessions: Dict[str, Optional[str]] = {}
+
+    async def replay_one(record):
+        endpoint = endpoint_override or ("stream" if record.get("endpoint", "").endswith("/stream") else "chat")
+        recorded_session = record.get("session_id")
+        body = {"message": record["message"]}
+        if recorded_session and sessions.get(recorded_session):
+            body["session_id"] = sessions[recorded_session]
+        if record.get("context") is not None:
+            body["context"] = record["context"]
+        session_id = await send(client, endpoint, body, recorder)
+        if recorded_session and session_id:
+            sessions[recorded_session] = session_id
+
+    tasks = []
+    t0 = records[0].get("ts", 0)
+    start = time.perf_counter()
+    for record in records:
+        due = start + (record.get("ts", t0) - t0) / speed
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        tasks.append(asyncio.create_task(replay_one(record)))
+    await asyncio.gather(*tasks)
+    return recorder.summary(time.perf_counter() - start)
+
+
+def saturation_point(rows: List[Dict]) -> Optional[Dict]:
+    """
+    Closed loop: the first concurrency after which adding clients raises
+    throughput by less than 10%. Open loop: the first rate at which the server
+    completes less than 80% of the offered load, fails more than 5% of
+    requests, or its median latency doubles from the lowest rate (queueing).
+    """
+    for i, row in enumerate(rows):
+        if row["mode"] == "closed":
+            if i + 1 < len(rows) and (rows[i + 1]["throughput_rps"] or 0) < 1.1 * (row["throughput_rps"] or 0):
+                return {"concurrency": row["level"], "throughput_rps": row["throughput_rps"]}
+        elif row["mode"] == "open":
+            base_p50 = rows[0]["p50_ms"]
+            if ((row["throughput_rps"] or 0) < 0.8 * row["offered_rps"] or (row["error_rate"] or 0) > 0.05
+                    or (base_p50 and row["p50_ms"] and row["p50_ms"] > 2 * base_p50)):
+                return {"rate": row["level"], "throughput_rps": row["throughput_rps"]}
+    return None
+
+
+def print_row(row: Dict):
+    def fmt(value):
+        return "-" if value is None else value
+    error_pct = None if row['error_rate'] is None else f"{row['error_rate'] * 100:.1f}"
+    print(f"{row['mode']:<7}{row['level']:>7}{row['requests']:>7}{row['ok']:>7}{fmt(error_pct):>7}"
+          f"{fmt(row['throughput_rps']):>8}{fmt(row['p50_ms']):>9}{fmt(row['p95_ms']):>9}{fmt(row['p99_ms']):>9}"
+          f"{fmt(row['first_token_p50_ms']):>10}")
+    if row["errors"]:
+        print(f"{'':<7}errors: {row['errors']}")
+
+
+async def run(args) -> Dict:
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("❌ loadtest.py needs httpx: pip install httpx")
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        try:
+            ready = await client.get("/readyz")
+        except httpx.TransportError as e:
+            sys.exit(f"❌ Backend not reachable at {args.url}: {e}")
+        if ready.status_code != 200:
+            sys.exit(f"❌ Backend at {args.url} is not ready ({ready.status_code})")
+
+        questions = load_test_questions()
+        rows = []
+        print(f"{'mode':<7}{'level':>7}{'reqs':>7}{'ok':>7}{'err %':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+              f"{'p99 ms':>9}{'ttft ms':>10}")
+        if args.replay:
+            records = load_request_log(args.replay)
+            if not records:
+                sys.exit(f"❌ No requests in {args.replay}")
+            row = {"mode": "replay", "level": f"{args.speed:g}x",
+                   **await replay(client, records, args.speed, args.endpoint_override)}
+            rows.append(row)
+            print_row(row)
+        elif args.rate:
+            for rate in args.rate:
+                row = {"mode": "open", "level": rate,
+                       **await open_loop(client, args.endpoint, questions, rate, args.duration,
+                                         args.requests, args.seed)}
+                rows.append(row)
+                print_row(row)
+        else:
+            for concurrency in args.concurrency:
+                row = {"mode": "closed", "level": concurrency,
+                       **await closed_loop(client, args.endpoint, questions, concurrency, args.duration,
+                                           args.requests)}
+                rows.append(row)
+                print_row(row)
+        if args.endpoint == "stream":
+            print("(ttft: time to first streamed token)")
+
+        saturation = saturation_point(rows) if len(rows) > 1 or args.rate else None
+        if saturation:
+            level = (f"concurrency {saturation['concurrency']}" if "concurrency" in saturation
+                     else f"{saturation['rate']} req/s offered")
+            print(f"📈 Saturates at {level} (~{saturation['throughput_rps']} req/s)")
+        elif len(rows) > 1:
+            print("📈 No saturation within the tested levels")
+
+        status = (await client.get("/api/status")).json()
+        return {"url": args.url, "endpoint": args.endpoint, "results": rows, "saturation": saturation,
+                "server": {key: status.get(key) for key in ("llm", "coalescing", "answer_cache", "sessions")}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/chat with a closed loop, open loop or log replay")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="chat")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    mode.add_argument("--rate", type=float, nargs="+", help="Open-loop arrival rates (requests/s)")
+    mode.add_argument("--replay", help="Replay a request log captured with REQUEST_LOG_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up factor")
+    parser.add_argument("--replay-endpoint", dest="endpoint_override", choices=ENDPOINTS,
+                        help="Send every replayed request to this endpoint instead of the recorded one")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per load level")
+    parser.add_argument("--requests", type=int, help="Stop each level after this many requests")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"✓ Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,29 +2,58 @@
 FastAPI Backend for Cotton Advisory RAG System
 Provides REST API endpoints for the React frontend
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-import pickle
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
 import os
+import hashlib
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
 from dotenv import load_dotenv
 import traceback
+import weakref
 
-import google.generativeai as genai
-USING_NEW_API = False
+from rag_engine import _flag, get_engine
+from llm_client import CircuitOpenError, LLMTimeoutError, status_code
+from extractive import extractive_answer
+from embedding_cache import embedding_cache, normalize_query
+from answer_cache import SemanticAnswerCache
+from batcher import MicroBatcher
+from single_flight import SingleFlight
+from sessions import Session, SessionStore, standalone_query
+from metrics import Registry, PROMETHEUS_CONTENT_TYPE, process_memory
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the RAG system in the background and clean up on shutdown"""
+    print("🚀 Starting Cotton Advisory API...")
+    # Loading runs off the event loop so liveness probes answer while artifacts load;
+    # /readyz reports 503 until initialization and warmup have finished.
+    init_task = asyncio.get_running_loop().run_in_executor(None, initialize_system)
+    init_task.add_done_callback(_log_initialization_result)
+    yield
+    init_task.cancel()
+    await embed_batcher.close()
+    await search_batcher.close()
+    cpu_executor.shutdown(wait=False)
+    request_log_executor.shutdown(wait=True)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Cotton Advisory API",
     description="RAG-powered API for cotton pest and disease management",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -37,21 +66,164 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global variables
-embedder = None
-index = None
-texts = None
-metadatas = None
-model = None
+# Concurrency limits
+# CPU-bound work (embedding, FAISS search) runs on a bounded thread pool so the
+# event loop stays free; LLM calls are awaited and capped by the LLM client.
+CPU_WORKERS = int(os.getenv("RAG_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", "64"))
+# Requests beyond MAX_INFLIGHT_REQUESTS queue for a slot; 503 only after waiting this long
+QUEUE_TIMEOUT_S = float(os.getenv("QUEUE_TIMEOUT_S", "10"))
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="rag-cpu")
+request_semaphore = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+
+# Loading, retrieval, context packing and the LLM client live in the shared
+# engine (rag_engine.py), configured by the same environment variables
+engine = get_engine()
+
+# Micro-batching: concurrent queries arriving within EMBED_BATCH_MAX_WAIT_MS are
+# embedded with one encode call and searched with one multi-row index.search
+EMBED_BATCHING = _flag("EMBED_BATCHING", "true")
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+# Batch endpoint limits
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+# Extractive fast path: when the LLM times out, is rate-limited or its circuit is
+# open, answer from the best sentences of the retrieved chunks instead of failing.
+# Requests with mode="fast" always take it. LLM_DEADLINE_S caps the whole wait
+# for the LLM (retries included; for streams, until the first token)
+FAST_PATH_FALLBACK = _flag("FAST_PATH_FALLBACK", "true")
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "20"))
+
+def llm_retry_budget(settings: dict) -> float:
+    """Worst-case time for one LLM call with all its retries and backoff sleeps"""
+    attempts = settings["max_retries"] + 1
+    sleeps = sum(min(settings["backoff_max"], settings["backoff_base"] * 2 ** i)
+                 for i in range(settings["max_retries"]))
+    return settings["timeout"] * attempts + sleeps
+
+if LLM_DEADLINE_S <= llm_retry_budget(engine.llm_settings):
+    print(f"⚠️ LLM_DEADLINE_S={LLM_DEADLINE_S:g}s is within LLM_TIMEOUT_S x attempts + backoff "
+          f"({llm_retry_budget(engine.llm_settings):g}s): timeouts will hit the deadline before they can be retried")
+FAST_PATH_HEADINGS = {
+    "requested": "⚡ Quick answer from the ICAR-CICR advisory:",
+    "timeout": "⏱️ The AI assistant is taking too long, so here are the most relevant points from the ICAR-CICR advisory:",
+    "rate_limited": "⏳ The AI assistant is busy, so here are the most relevant points from the ICAR-CICR advisory:",
+    "unavailable": "⚠️ The AI assistant is temporarily unavailable, so here are the most relevant points from the ICAR-CICR advisory:",
+}
+
+# Single-flight: concurrent requests with the same normalized question and
+# conversation context share one embed/search/LLM computation (and one stream)
+COALESCE_REQUESTS = _flag("COALESCE_REQUESTS", "true")
+answer_flight = SingleFlight("answer")
+stream_flight = SingleFlight("stream")
+
+# Server-side sessions: clients send session_id instead of the whole history.
+# Each session keeps the last few messages and a bounded rolling summary of
+# older turns; sessions evicted from memory spill to SESSION_SPILL_DIR if set
+session_store = SessionStore(
+    maxsize=int(os.getenv("SESSION_MAX", "10000")),
+    ttl=float(os.getenv("SESSION_TTL_S", "86400")),
+    message_chars=int(os.getenv("SESSION_MESSAGE_CHARS", "600")),
+    summary_chars=int(os.getenv("SESSION_SUMMARY_CHARS", "1200")),
+    spill_dir=os.getenv("SESSION_SPILL_DIR") or None
+)
+
+# Request capture for load-test replay (loadtest.py --replay): one JSON line per
+# chat request with its arrival time. Unset to disable
+REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH") or None
+# One writer thread keeps file I/O off the event loop and lines in order
+request_log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-request-log")
+
+# Semantic answer cache: near-duplicate questions reuse a previous answer
+ANSWER_CACHE_ENABLED = _flag("ANSWER_CACHE_ENABLED", "true")
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    index_path='faiss_index.bin'
+)
+
+# Metrics (Prometheus text format at /metrics)
+metrics_registry = Registry()
+STAGE_LATENCY = metrics_registry.histogram(
+    "rag_stage_duration_seconds", "Latency of each answer pipeline stage", ["stage"])
+REQUESTS = metrics_registry.counter(
+    "rag_requests_total", "Chat requests received", ["endpoint"])
+IN_FLIGHT = metrics_registry.gauge(
+    "rag_requests_in_flight", "Chat requests currently being processed")
+ERRORS = metrics_registry.counter(
+    "rag_errors_total", "Answer pipeline errors by category", ["category"])
+CACHE_HITS = metrics_registry.counter(
+    "rag_cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = metrics_registry.counter(
+    "rag_cache_misses_total", "Cache misses", ["cache"])
+COALESCED_REQUESTS = metrics_registry.counter(
+    "rag_coalesced_requests_total", "Requests that joined an identical in-flight request", ["endpoint"])
+SESSIONS = metrics_registry.gauge(
+    "rag_sessions", "Conversation sessions held in memory")
+LLM_RETRIES = metrics_registry.counter(
+    "rag_llm_retries_total", "LLM calls retried after a transient error")
+LLM_CIRCUIT_OPEN = metrics_registry.gauge(
+    "rag_llm_circuit_open", "1 while the LLM circuit breaker is open or half-open")
+LLM_CIRCUIT_REJECTIONS = metrics_registry.counter(
+    "rag_llm_circuit_rejections_total", "LLM calls failed fast by the open circuit breaker")
+FAST_PATH_ANSWERS = metrics_registry.counter(
+    "rag_fast_path_answers_total", "Answers extracted from retrieved chunks without the LLM", ["reason"])
+RERANK_FALLBACKS = metrics_registry.counter(
+    "rag_rerank_fallbacks_total", "Searches that skipped reranking to stay within the latency budget")
+CONTEXT_TOKENS_SAVED = metrics_registry.histogram(
+    "rag_context_tokens_saved", "Estimated prompt tokens saved per request by context packing",
+    buckets=(0, 25, 50, 100, 200, 400, 800, 1600))
+INDEX_VECTORS = metrics_registry.gauge(
+    "rag_index_vectors", "Vectors in the FAISS index")
+PROCESS_RSS = metrics_registry.gauge(
+    "rag_process_resident_memory_bytes", "Resident memory of this worker process")
+
+STARTUP_PHASE = metrics_registry.gauge(
+    "rag_startup_phase_seconds", "Time spent in each startup phase", ["phase"])
+
+EXAMPLE_QUESTIONS = [
+    "What are the main pests affecting cotton crops?",
+    "How to control pink bollworm in cotton?",
+    "What is the recommended dosage for whitefly control?",
+    "What preventive measures can reduce pest infestation?",
+    "What are the symptoms of cotton leaf curl disease?",
+    "How to identify early signs of pest infestation?",
+    "What biological control methods are effective?",
+    "What are the best agricultural practices?"
+]
+
+system_ready = False
 
 class ChatRequest(BaseModel):
     message: str
-    context: Optional[List[Dict]] = None  # Conversation history for context
+    session_id: Optional[str] = None  # Server-side conversation session
+    context: Optional[List[Dict]] = None  # Conversation history; (re)seeds the session when given
+    mode: Literal["full", "fast"] = "full"  # "fast": extractive answer from the advisory, no LLM call
 
 class ChatResponse(BaseModel):
     answer: str
     success: bool
     sources: Optional[List[Dict]] = None
+    session_id: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    stream: bool = False  # Stream NDJSON lines as answers finish instead of one ordered response
+
+class BatchChatItem(BaseModel):
+    index: int
+    question: str
+    answer: str
+    success: bool
+    sources: Optional[List[Dict]] = None
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatItem]
 
 class SystemStatus(BaseModel):
     status: str
@@ -59,42 +231,37 @@ class SystemStatus(BaseModel):
     model_loaded: bool
     index_loaded: bool
     chunks_count: int
+    embedding_cache: Optional[Dict] = None
+    answer_cache: Optional[Dict] = None
+    batching: Optional[Dict] = None
+    memory: Optional[Dict] = None
+    index: Optional[Dict] = None
+    rerank: Optional[Dict] = None
+    llm: Optional[Dict] = None
+    coalescing: Optional[Dict] = None
+    sessions: Optional[Dict] = None
+    startup: Optional[Dict[str, float]] = None
 
 def initialize_system():
-    """Initialize all RAG components"""
-    global embedder, index, texts, metadatas, model
+    """Load and warm up all RAG components through the shared engine"""
+    global system_ready
     
     try:
-        # Load API key
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        
-        api_key = api_key.strip()
-        if not api_key.startswith('AIza'):
-            raise ValueError("Invalid API key format")
-        
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        
-        # Load FAISS index and chunks
-        if not os.path.exists('chunks.pkl'):
-            raise FileNotFoundError("chunks.pkl not found")
-        if not os.path.exists('faiss_index.bin'):
-            raise FileNotFoundError("faiss_index.bin not found")
-        
-        with open('chunks.pkl', 'rb') as f:
-            chunk_data = pickle.load(f)
-            texts = chunk_data['texts']
-            metadatas = chunk_data['metadatas']
-        
-        index = faiss.read_index('faiss_index.bin')
-        embedder = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+        engine.stage_timer = lambda stage: STAGE_LATENCY.time(stage=stage)
+        engine.warmup_queries = EXAMPLE_QUESTIONS
+        engine.ensure_loaded()
+        for phase, seconds in engine.startup_timings.items():
+            STARTUP_PHASE.set(seconds, phase=phase)
+        system_ready = True
         
         print("✅ System initialized successfully!")
-        print(f"📊 Loaded {len(texts)} chunks")
-        print(f"🤖 Using {'new google.genai' if USING_NEW_API else 'legacy google.generativeai'}")
+        print(f"📊 Loaded {len(engine.texts)} chunks")
+        print(f"🧠 Embeddings: {engine.embedding_backend} backend")
+        print("⏱️ Startup: " + ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in engine.startup_timings.items()))
+        if engine.llm_backend == "fake":
+            print("🤖 Using local fake LLM")
+        else:
+            print("🤖 Using legacy google.generativeai")
         return True
         
     except Exception as e:
@@ -102,123 +269,519 @@ def initialize_system():
         print(traceback.format_exc())
         return False
 
-def retrieve(query: str, k: int = 5) -> List[Dict]:
-    """Retrieve relevant chunks"""
+def _log_initialization_result(future):
+    if not future.cancelled() and not future.result():
+        print("⚠️ Warning: System initialization failed. Some features may not work.")
+
+def format_context_with_citations(results: List[Dict]) -> str:
+    """Format retrieved context through the engine, recording the tokens saved by packing"""
+    context, stats = engine.pack_context(results)
+    if stats is not None:
+        CONTEXT_TOKENS_SAVED.observe(stats['tokens_saved'])
+    return context
+
+def extract_sources(retrieved: List[Dict]) -> List[Dict]:
+    """Summarize the top retrieved chunks for the response payload"""
+    return [{
+        'page': r['metadata'].get('page', '?'),
+        'text': r['text'][:200] + '...'
+    } for r in retrieved[:3]]
+
+ERROR_MESSAGES = {
+    "unavailable": "⚠️ The AI service is temporarily unavailable. Our team has been notified. Please try again in a few moments.",
+    "rate_limited": "⏳ Service is currently busy. Please wait a moment and try again.",
+    "timeout": "⏱️ Request timed out. Please try a shorter question or try again.",
+    "api_key": "🔑 Service configuration issue. Please contact support.",
+    "other": "❌ Unable to process your request right now. Please try rephrasing your question.",
+}
+
+def classify_error(e: Exception) -> str:
+    """Map an exception to an error category"""
+    if isinstance(e, CircuitOpenError):
+        return "unavailable"
+    if isinstance(e, TimeoutError):
+        return "timeout"
+    code = status_code(e)
+    if code == 429:
+        return "rate_limited"
+    if code is not None and code >= 500:
+        return "unavailable"
+    error_str = str(e).lower()
+    if "404" in error_str or "not found" in error_str:
+        return "unavailable"
+    elif "quota" in error_str or "rate limit" in error_str:
+        return "rate_limited"
+    elif "timeout" in error_str:
+        return "timeout"
+    elif "api key" in error_str:
+        return "api_key"
+    else:
+        return "other"
+
+def report_error(e: Exception, label: str = "Error") -> str:
+    """Log and count an error, returning the user-facing message"""
+    category = classify_error(e)
+    ERRORS.inc(category=category)
+    print(f"❌ {label}: {type(e).__name__} - {str(e)}")
+    return ERROR_MESSAGES[category]
+
+def conversation_scope(conversation_context: Optional[List[Dict]], summary: str = "") -> str:
+    """Digest of the history and summary a prompt is built with ("" without any)"""
+    if not conversation_context and not summary:
+        return ""
+    payload = json.dumps([conversation_context or [], summary], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def lookup_cached_answer(query_emb: np.ndarray, scope: str = "") -> Optional[Dict]:
+    """Check the semantic answer cache, recording hit/miss metrics"""
+    cached = answer_cache.lookup(query_emb, scope)
+    if cached is None:
+        CACHE_MISSES.inc(cache="answer")
+    else:
+        CACHE_HITS.inc(cache="answer")
+    return cached
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """Run blocking CPU work on the bounded executor instead of the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, partial(func, *args, **kwargs))
+
+def _embed_batch(queries: List[str]) -> List[np.ndarray]:
+    embs = engine.embed_many(queries)
+    return [embs[i:i + 1] for i in range(len(queries))]
+
+def _search_batch(items: List[tuple]) -> List[List[Dict]]:
+    embs = np.vstack([emb for emb, _, _ in items])
+    max_k = max(k for _, k, _ in items)
+    queries = [query for _, _, query in items]
+    return [results[:k] for results, (_, k, _) in zip(engine.search_many(embs, max_k, queries), items)]
+
+embed_batcher = MicroBatcher(
+    _embed_batch, cpu_executor,
+    max_batch=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+    max_concurrent_batches=CPU_WORKERS, name="embed"
+)
+search_batcher = MicroBatcher(
+    _search_batch, cpu_executor,
+    max_batch=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+    max_concurrent_batches=CPU_WORKERS, name="search"
+)
+
+async def embed_query_async(query: str) -> np.ndarray:
+    """Embed a query off the event loop, micro-batched with concurrent requests"""
+    if EMBED_BATCHING:
+        return await embed_batcher.submit(query)
+    return await run_cpu_bound(engine.embed_query, query)
+
+async def search_async(query_emb: np.ndarray, query: str, k: int = 5) -> List[Dict]:
+    """Search off the event loop, micro-batched with concurrent requests"""
+    if EMBED_BATCHING:
+        return await search_batcher.submit((query_emb, k, query))
+    return await run_cpu_bound(engine.search, query_emb, k, query)
+
+async def generate_answer(prompt: str) -> str:
+    """Call Gemini through the shared client (concurrency limit, timeout, retries, circuit breaker)"""
+    if engine.llm_client is None:
+        raise RuntimeError("Model not initialized")
+    
+    with STAGE_LATENCY.time(stage="llm"):
+        return await within_llm_deadline(engine.llm_client.generate(prompt))
+
+async def within_llm_deadline(awaitable):
+    """Await an LLM call, giving up after LLM_DEADLINE_S (retries included)"""
     try:
-        if embedder is None or index is None:
-            raise RuntimeError("System not initialized")
+        return await asyncio.wait_for(awaitable, LLM_DEADLINE_S)
+    except LLMTimeoutError:
+        raise
+    except asyncio.TimeoutError:
+        raise LLMTimeoutError(f"LLM deadline of {LLM_DEADLINE_S:g}s exceeded") from None
+
+def fast_answer(query: str, retrieved: List[Dict], reason: str) -> Optional[str]:
+    """Extractive answer from the retrieved chunks, without calling the LLM"""
+    with STAGE_LATENCY.time(stage="fast_path"):
+        answer = extractive_answer(query, retrieved, FAST_PATH_HEADINGS[reason])
+    if answer is not None:
+        FAST_PATH_ANSWERS.inc(reason=reason)
+    return answer
+
+def fallback_answer(query: str, retrieved: List[Dict], e: Exception) -> Optional[str]:
+    """Extractive answer in place of a failed LLM call, if the fast path covers the failure"""
+    category = classify_error(e)
+    if not FAST_PATH_FALLBACK or category not in ("timeout", "rate_limited", "unavailable"):
+        return None
+    answer = fast_answer(query, retrieved, category)
+    if answer is not None:
+        ERRORS.inc(category=category)
+        print(f"⚡ LLM {category} ({type(e).__name__}: {e}); answered from retrieved chunks")
+    return answer
+
+async def answer_from_retrieved(query: str, query_emb: np.ndarray, retrieved: List[Dict],
+                                conversation_context: Optional[List[Dict]] = None,
+                                use_cache: bool = False, summary: str = "",
+                                mode: str = "full") -> tuple[str, bool, List[Dict]]:
+    """Build the prompt from retrieved chunks and generate the answer"""
+    if not retrieved:
+        return "⚠️ No relevant information found.", False, []
+    
+    sources = extract_sources(retrieved)
+    if mode == "fast":
+        answer = fast_answer(query, retrieved, "requested")
+        if answer is None:
+            return "⚠️ No relevant information found.", False, []
+        return answer, True, sources
+    
+    with STAGE_LATENCY.time(stage="context"):
+        context = format_context_with_citations(retrieved)
+        prompt = engine.build_prompt(query, context, conversation_context, summary)
+    
+    # Get response
+    try:
+        answer = await generate_answer(prompt)
+    except Exception as e:
+        answer = fallback_answer(query, retrieved, e)
+        if answer is None:
+            raise
+        # Degraded answers are not cached
+        return answer, True, sources
+    
+    if not answer or len(answer.strip()) < 10:
+        raise ValueError("Generated answer too short")
+    
+    if use_cache:
+        answer_cache.store(query, query_emb, answer, sources, conversation_scope(conversation_context, summary))
+    
+    return answer, True, sources
+
+async def answer_question(query: str, conversation_context: Optional[List[Dict]] = None, summary: str = "",
+                          search_query: Optional[str] = None, mode: str = "full") -> tuple[str, bool, List[Dict]]:
+    """
+    Generate answer using RAG with conversation context.
+    search_query (a follow-up rewritten as a standalone question) is used for
+    retrieval in place of query; the prompt always asks the original question.
+    mode="fast" answers from the retrieved chunks without the LLM.
+    """
+    try:
+        if not query or not query.strip():
+            return "⚠️ Please enter a question.", False, []
+        search_query = search_query or query
         
-        query_emb = embedder.encode([query], convert_to_numpy=True)
-        D, I = index.search(query_emb, k)
+        with STAGE_LATENCY.time(stage="total"):
+            with STAGE_LATENCY.time(stage="embed"):
+                query_emb = await embed_query_async(search_query)
+            
+            # Matched on the standalone (search) query within the same conversation history,
+            # so identical conversations share answers. Fast mode stays extractive: never
+            # serve a cached LLM answer
+            use_cache = ANSWER_CACHE_ENABLED and mode != "fast"
+            if use_cache:
+                cached = lookup_cached_answer(query_emb, conversation_scope(conversation_context, summary))
+                if cached is not None:
+                    return cached['answer'], True, cached['sources']
+            
+            # Retrieve context
+            with STAGE_LATENCY.time(stage="search"):
+                retrieved = await search_async(query_emb, search_query, k=5)
+            return await answer_from_retrieved(query, query_emb, retrieved, conversation_context, use_cache,
+                                               summary, mode)
         
-        results = []
-        for idx_pos, idx in enumerate(I[0]):
-            if idx < len(texts):
-                results.append({
-                    'text': texts[idx],
-                    'metadata': metadatas[idx],
-                    'distance': float(D[0][idx_pos])
-                })
+    except Exception as e:
+        return report_error(e), False, []
+
+async def answer_batch(questions: List[str]):
+    """
+    Answer many questions at once.
+    All questions are embedded with one encode call and searched with one
+    multi-row index.search; LLM calls then run with bounded parallelism.
+    Yields result dicts (with their original `index`) as they complete.
+    """
+    results = {}
+    pending, retrieved_rows = [], []
+    valid = []
+    for i, q in enumerate(questions):
+        if q and q.strip():
+            valid.append(i)
+        else:
+            results[i] = ("⚠️ Please enter a question.", False, [])
+    
+    try:
+        if valid:
+            with STAGE_LATENCY.time(stage="embed"):
+                embs = await run_cpu_bound(engine.embed_many, [questions[i] for i in valid])
+            for row, i in enumerate(valid):
+                cached = lookup_cached_answer(embs[row:row + 1]) if ANSWER_CACHE_ENABLED else None
+                if cached is not None:
+                    results[i] = (cached['answer'], True, cached['sources'])
+                else:
+                    pending.append((row, i))
         
-        return results
+        if pending:
+            pending_embs = np.vstack([embs[row:row + 1] for row, _ in pending])
+            with STAGE_LATENCY.time(stage="search"):
+                retrieved_rows = await run_cpu_bound(
+                    engine.search_many, pending_embs, 5, [questions[i] for _, i in pending])
     except Exception as e:
-        print(f"Retrieval error: {e}")
-        raise
+        message = report_error(e, "Batch retrieval error")
+        for i in valid:
+            results.setdefault(i, (message, False, []))
+        pending, retrieved_rows = [], []
+    
+    for i in sorted(results):
+        answer, success, sources = results[i]
+        yield {"index": i, "question": questions[i], "answer": answer, "success": success, "sources": sources or None}
+    
+    parallelism = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    
+    async def answer_one(row: int, i: int, retrieved: List[Dict]):
+        async with parallelism:
+            try:
+                answer, success, sources = await answer_from_retrieved(
+                    questions[i], embs[row:row + 1], retrieved, use_cache=ANSWER_CACHE_ENABLED
+                )
+            except Exception as e:
+                answer, success, sources = report_error(e), False, []
+        return {"index": i, "question": questions[i], "answer": answer, "success": success, "sources": sources or None}
+    
+    tasks = [asyncio.ensure_future(answer_one(row, i, retrieved))
+             for (row, i), retrieved in zip(pending, retrieved_rows)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
 
-def format_context_with_citations(results: List[Dict]) -> str:
-    """Format retrieved context"""
-    context = ""
-    for r in results:
-        page = r['metadata'].get('page_label', r['metadata'].get('page', '?'))
-        context += f"[Source p.{page}] {r['text']}\n\n"
-    return context
+def sse_event(event: str, data: Dict) -> str:
+    """Encode a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-def answer_question(query: str, conversation_context: Optional[List[Dict]] = None) -> tuple[str, bool, List[Dict]]:
-    """Generate answer using RAG with conversation context"""
+def flight_key(query: str, conversation_context: Optional[List[Dict]], summary: str = "",
+               search_query: Optional[str] = None, mode: str = "full") -> tuple:
+    """
+    Requests are identical when their normalized question, standalone
+    question, conversation history and summary, and mode all match
+    """
+    return (normalize_query(query), normalize_query(search_query or query),
+            conversation_scope(conversation_context, summary), mode)
+
+async def coalesced_answer(query: str, conversation_context: Optional[List[Dict]] = None, summary: str = "",
+                           search_query: Optional[str] = None, mode: str = "full") -> tuple[str, bool, List[Dict]]:
+    """answer_question, shared by identical concurrent requests"""
+    args = (query, conversation_context, summary, search_query, mode)
+    if not COALESCE_REQUESTS:
+        return await answer_question(*args)
+    return await answer_flight.do(flight_key(*args), partial(answer_question, *args))
+
+class Admission:
+    """An in-flight request slot, released exactly once"""
+    
+    def __init__(self):
+        self.released = False
+    
+    def release(self):
+        if not self.released:
+            self.released = True
+            request_semaphore.release()
+
+async def admit() -> Admission:
+    """Queue for an in-flight slot; 503 if none frees up within QUEUE_TIMEOUT_S"""
+    try:
+        await asyncio.wait_for(request_semaphore.acquire(), QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is at capacity. Please retry shortly."
+        )
+    return Admission()
+
+def streaming_admitted(body, admission: Admission):
+    """Hold the slot until the streamed body finishes (or is dropped unstarted)"""
+    async def guarded():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            admission.release()
+    
+    guarded_body = guarded()
+    # A response cancelled before streaming starts never runs the finally above
+    weakref.finalize(guarded_body, admission.release)
+    return guarded_body
+
+def _append_request_log(line: str):
+    try:
+        with open(REQUEST_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"⚠️ Could not write request log: {e}")
+
+def log_request(endpoint: str, request: ChatRequest, arrival: float, session_id: Optional[str]):
+    """Queue the request (with its arrival time and session) for REQUEST_LOG_PATH, if set"""
+    if REQUEST_LOG_PATH is None:
+        return
+    record = {"ts": arrival, "endpoint": endpoint, "message": request.message, "session_id": session_id}
+    if request.context is not None:
+        record["context"] = request.context
+    request_log_executor.submit(_append_request_log, json.dumps(record, ensure_ascii=False) + "\n")
+
+def open_session(request: ChatRequest) -> Session:
+    """
+    The request's session, re-seeded from request.context when given. A
+    session_id this process does not hold (restart, eviction, expiry or
+    another worker) without context is a 409, so the client resends its
+    recent messages instead of silently losing the history.
+    """
+    if request.context is not None:
+        session = session_store.get(request.session_id)
+        session_store.reset(session, request.context)
+        return session
+    if request.session_id is None:
+        return session_store.get()
+    session = session_store.find(request.session_id)
+    if session is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Session not found. Resend the request with its conversation context."
+        )
+    return session
+
+async def admit_chat(endpoint: str, request: ChatRequest) -> tuple[Admission, Session]:
+    """
+    Admit a chat request, then open its session. Requests are logged with
+    their arrival time (so replays reproduce the real arrival rate) even when
+    rejected at capacity, but only admitted requests create or re-seed a session.
+    """
+    arrival = time.time()
+    try:
+        admission = await admit()
+    except HTTPException:
+        log_request(endpoint, request, arrival, request.session_id)
+        raise
+    try:
+        session = open_session(request)
+    except Exception:
+        admission.release()
+        raise
+    log_request(endpoint, request, arrival, session.id)
+    return admission, session
+
+async def stream_events(query: str, conversation_context: Optional[List[Dict]], summary: str = "",
+                        search_query: Optional[str] = None, mode: str = "full"):
+    """
+    Generate an answer as (event, data) pairs for Server-Sent Events.
+    Emits `sources` as soon as retrieval finishes, then `token` events as the
+    model produces text, and finally `done` (or `error`). Fast-path answers
+    arrive as a single `token` event and are marked `fast` in `done`.
+    """
+    request_start = time.perf_counter()
+    stream = None
+    retrieved, parts = [], []
     try:
         if not query or not query.strip():
-            return "⚠️ Please enter a question.", False, []
+            yield "error", {"message": "⚠️ Please enter a question."}
+            return
         
-        # Retrieve context
-        retrieved = retrieve(query, k=5)
-        if not retrieved:
-            return "⚠️ No relevant information found.", False, []
+        search_query = search_query or query
+        with STAGE_LATENCY.time(stage="embed"):
+            query_emb = await embed_query_async(search_query)
         
-        context = format_context_with_citations(retrieved)
+        use_cache = ANSWER_CACHE_ENABLED and mode != "fast"
+        scope = conversation_scope(conversation_context, summary)
+        if use_cache:
+            cached = lookup_cached_answer(query_emb, scope)
+            if cached is not None:
+                yield "sources", {"sources": cached['sources']}
+                yield "token", {"text": cached['answer']}
+                yield "done", {"success": True, "cached": True}
+                return
         
-        # Build conversation history context
-        conversation_history = ""
-        if conversation_context and len(conversation_context) > 0:
-            conversation_history = "\n\nPrevious conversation:\n"
-            for msg in conversation_context[-3:]:  # Use last 3 messages for context
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                conversation_history += f"{role.upper()}: {content}\n"
+        with STAGE_LATENCY.time(stage="search"):
+            retrieved = await search_async(query_emb, search_query, k=5)
+        if not retrieved:
+            yield "error", {"message": "⚠️ No relevant information found."}
+            return
         
-        # Create prompt with conversation context
-        prompt = f"""You are a Cotton Pest and Disease Management expert assistant. Answer the following question using the provided context from the ICAR-CICR Advisory document.
-{conversation_history}
-Guidelines:
-- Provide accurate, actionable information for cotton farmers
-- Cite sources using [Source p.X] format for every fact
-- If the context doesn't contain the answer, clearly state that
-- Be concise but comprehensive
-- Use bullet points for multiple items
-- Focus on practical recommendations
-- Consider the conversation history to provide contextually relevant answers
-
-Context:
-{context}
-
-Question: {query}
-
-Answer:"""
+        sources = extract_sources(retrieved)
+        yield "sources", {"sources": sources}
         
-        # Get response
-        if model is None:
-            raise RuntimeError("Model not initialized")
+        if mode == "fast":
+            answer = fast_answer(query, retrieved, "requested")
+            if answer is None:
+                yield "error", {"message": "⚠️ No relevant information found."}
+                return
+            yield "token", {"text": answer}
+            yield "done", {"success": True, "fast": True}
+            return
         
-        response = model.generate_content(prompt)
-        answer = response.text
+        with STAGE_LATENCY.time(stage="context"):
+            context = format_context_with_citations(retrieved)
+            prompt = engine.build_prompt(query, context, conversation_context, summary)
         
-        if not answer or len(answer.strip()) < 10:
-            raise ValueError("Generated answer too short")
+        if engine.llm_client is None:
+            raise RuntimeError("Model not initialized")
         
-        # Extract sources
-        sources = [{
-            'page': r['metadata'].get('page', '?'),
-            'text': r['text'][:200] + '...'
-        } for r in retrieved[:3]]
+        llm_start = time.perf_counter()
+        stream = engine.llm_client.stream(prompt)
+        try:
+            text = await within_llm_deadline(stream.__anext__())
+        except StopAsyncIteration:
+            text = None
+        if text is not None:
+            parts.append(text)
+            yield "token", {"text": text}
+            async for text in stream:
+                parts.append(text)
+                yield "token", {"text": text}
+        STAGE_LATENCY.observe(time.perf_counter() - llm_start, stage="llm")
         
-        return answer, True, sources
+        answer = "".join(parts)
+        if use_cache and len(answer.strip()) >= 10:
+            answer_cache.store(query, query_emb, answer, sources, scope)
         
+        yield "done", {"success": True}
+    
+    except asyncio.CancelledError:
+        # Every client went away mid-stream; stop generating and release resources
+        print("ℹ️ Stream cancelled by client")
+        raise
     except Exception as e:
-        error_type = type(e).__name__
-        error_str = str(e)
-        print(f"❌ Error: {error_type} - {error_str}")
-        
-        # Provide user-friendly error messages
-        if "404" in error_str or "not found" in error_str.lower():
-            user_msg = "⚠️ The AI service is temporarily unavailable. Our team has been notified. Please try again in a few moments."
-        elif "quota" in error_str.lower() or "rate limit" in error_str.lower():
-            user_msg = "⏳ Service is currently busy. Please wait a moment and try again."
-        elif "timeout" in error_str.lower():
-            user_msg = "⏱️ Request timed out. Please try a shorter question or try again."
-        elif "api key" in error_str.lower():
-            user_msg = "🔑 Service configuration issue. Please contact support."
+        # Before any text was sent, an LLM failure can still be answered from the retrieved chunks
+        answer = fallback_answer(query, retrieved, e) if retrieved and not parts else None
+        if answer is not None:
+            yield "token", {"text": answer}
+            yield "done", {"success": True, "fast": True}
         else:
-            user_msg = "❌ Unable to process your request right now. Please try rephrasing your question."
-        
-        return user_msg, False, []
+            yield "error", {"message": report_error(e, "Stream error")}
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - request_start, stage="total")
+        if stream is not None and hasattr(stream, "aclose"):
+            await stream.aclose()
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    """Initialize system on startup"""
-    print("🚀 Starting Cotton Advisory API...")
-    success = initialize_system()
-    if not success:
-        print("⚠️ Warning: System initialization failed. Some features may not work.")
+async def stream_answer(query: str, session: Session, http_request: Request, mode: str = "full"):
+    """
+    Stream an answer to one client; identical concurrent questions share one
+    generation. The completed answer is recorded in the client's session.
+    """
+    history = list(session.messages)
+    search_query = standalone_query(query, session)
+    args = (query, history, session.summary, search_query, mode)
+    if COALESCE_REQUESTS:
+        events = stream_flight.stream(flight_key(*args), partial(stream_events, *args))
+    else:
+        events = stream_events(*args)
+    yield sse_event("session", {"session_id": session.id})
+    parts = []
+    try:
+        async for event, data in events:
+            if await http_request.is_disconnected():
+                print("ℹ️ Client disconnected, stopping stream")
+                return
+            if event == "token":
+                parts.append(data["text"])
+            elif event == "done":
+                session_store.record(session, query, "".join(parts), search_query)
+            yield sse_event(event, data)
+    finally:
+        await events.aclose()
 
 # API Endpoints
 @app.get("/")
@@ -230,35 +793,105 @@ async def root():
         "status": "running"
     }
 
+@app.get("/healthz")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe: artifacts are loaded and warmed up"""
+    if not system_ready:
+        return Response(
+            content=json.dumps({"status": "starting", "startup": engine.startup_timings}),
+            status_code=503,
+            media_type="application/json"
+        )
+    return {"status": "ready", "startup": engine.startup_timings}
+
 @app.get("/api/status", response_model=SystemStatus)
 async def get_status():
     """Get system status"""
     return SystemStatus(
-        status="healthy" if model is not None else "unhealthy",
-        message="System operational" if model is not None else "System not initialized",
-        model_loaded=model is not None,
-        index_loaded=index is not None,
-        chunks_count=len(texts) if texts is not None else 0
+        status="healthy" if system_ready else "unhealthy",
+        message="System operational" if system_ready else "System not initialized",
+        model_loaded=engine.model is not None,
+        index_loaded=engine.index is not None,
+        chunks_count=len(engine.texts) if engine.texts is not None else 0,
+        embedding_cache=embedding_cache.stats(),
+        answer_cache=answer_cache.stats(),
+        batching={
+            "enabled": EMBED_BATCHING,
+            "embed": embed_batcher.stats(),
+            "search": search_batcher.stats()
+        },
+        memory=process_memory(),
+        index=engine.index_stats(),
+        rerank=engine.reranker.stats() if engine.reranker is not None else None,
+        llm=engine.llm_client.stats() if engine.llm_client is not None else None,
+        coalescing={
+            "enabled": COALESCE_REQUESTS,
+            "answer": answer_flight.stats(),
+            "stream": stream_flight.stats()
+        },
+        sessions=session_store.stats(),
+        startup=engine.startup_timings or None
     )
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics"""
+    embedding_stats = embedding_cache.stats()
+    CACHE_HITS.set(embedding_stats["hits"], cache="embedding")
+    CACHE_MISSES.set(embedding_stats["misses"], cache="embedding")
+    INDEX_VECTORS.set(engine.index.ntotal if engine.index is not None else 0)
+    PROCESS_RSS.set(process_memory()["rss_bytes"] or 0)
+    if engine.reranker is not None:
+        rerank_stats = engine.reranker.stats()
+        CACHE_HITS.set(rerank_stats["hits"], cache="rerank")
+        CACHE_MISSES.set(rerank_stats["misses"], cache="rerank")
+        RERANK_FALLBACKS.set(rerank_stats["fallbacks"])
+    SESSIONS.set(session_store.stats()["sessions"])
+    COALESCED_REQUESTS.set(answer_flight.coalesced, endpoint="chat")
+    COALESCED_REQUESTS.set(stream_flight.coalesced, endpoint="chat_stream")
+    if engine.llm_client is not None:
+        llm_stats = engine.llm_client.stats()
+        LLM_RETRIES.set(llm_stats["retries"])
+        LLM_CIRCUIT_OPEN.set(0 if llm_stats["circuit_state"] == "closed" else 1)
+        LLM_CIRCUIT_REJECTIONS.set(llm_stats["circuit_rejections"])
+    return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Chat endpoint with conversation context support"""
     try:
-        if model is None:
+        if not system_ready:
             raise HTTPException(
                 status_code=503,
                 detail="System not initialized. Please check server logs."
             )
         
-        answer, success, sources = answer_question(request.message, request.context)
+        admission, session = await admit_chat("/api/chat", request)
+        REQUESTS.inc(endpoint="chat")
+        search_query = standalone_query(request.message, session)
+        try:
+            with IN_FLIGHT.track_inprogress():
+                answer, success, sources = await coalesced_answer(
+                    request.message, list(session.messages), session.summary, search_query, request.mode)
+        finally:
+            admission.release()
+        if success:
+            session_store.record(session, request.message, answer, search_query)
         
         return ChatResponse(
             answer=answer,
             success=success,
-            sources=sources if sources else None
+            sources=sources if sources else None,
+            session_id=session.id
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Chat error: {e}")
         raise HTTPException(
@@ -266,21 +899,75 @@ async def chat(request: ChatRequest):
             detail=f"Internal server error: {str(e)}"
         )
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Streaming chat endpoint (Server-Sent Events)"""
+    if not system_ready:
+        raise HTTPException(
+            status_code=503,
+            detail="System not initialized. Please check server logs."
+        )
+    
+    admission, session = await admit_chat("/api/chat/stream", request)
+    REQUESTS.inc(endpoint="chat_stream")
+    
+    async def event_source():
+        with IN_FLIGHT.track_inprogress():
+            async for event in stream_answer(request.message, session, http_request, request.mode):
+                yield event
+    
+    return StreamingResponse(
+        streaming_admitted(event_source(), admission),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest):
+    """Answer a list of questions; ordered JSON response or NDJSON stream"""
+    if not system_ready:
+        raise HTTPException(
+            status_code=503,
+            detail="System not initialized. Please check server logs."
+        )
+    
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many questions. Maximum per batch is {BATCH_MAX_QUESTIONS}."
+        )
+    
+    admission = await admit()
+    REQUESTS.inc(endpoint="chat_batch")
+    
+    if request.stream:
+        async def ndjson_lines():
+            with IN_FLIGHT.track_inprogress():
+                async for item in answer_batch(request.questions):
+                    yield json.dumps(item, ensure_ascii=False) + "\n"
+        
+        return StreamingResponse(streaming_admitted(ndjson_lines(), admission), media_type="application/x-ndjson")
+    
+    try:
+        with IN_FLIGHT.track_inprogress():
+            items = [item async for item in answer_batch(request.questions)]
+    finally:
+        admission.release()
+    
+    items.sort(key=lambda item: item["index"])
+    return BatchChatResponse(results=[BatchChatItem(**item) for item in items])
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a conversation session"""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": session_id}
+
 @app.get("/api/examples")
 async def get_examples():
     """Get example questions"""
-    return {
-        "examples": [
-            "What are the main pests affecting cotton crops?",
-            "How to control pink bollworm in cotton?",
-            "What is the recommended dosage for whitefly control?",
-            "What preventive measures can reduce pest infestation?",
-            "What are the symptoms of cotton leaf curl disease?",
-            "How to identify early signs of pest infestation?",
-            "What biological control methods are effective?",
-            "What are the best agricultural practices?"
-        ]
-    }
+    return {"examples": EXAMPLE_QUESTIONS}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,424 @@
+"""
+Shared RAG engine
+One object owns the chunk store, FAISS index, BM25 index, query embedder,
+reranker and LLM client, and does retrieval, context formatting and prompt
+building on top of them. The API (main.py), the Gradio app (app.py) and the
+CLI (rag_qa.py) all go through get_engine(), so a retrieval or LLM feature is
+built once and reaches every entry point.
+
+Importing this module loads nothing. Retrieval artifacts are loaded on first
+use (or by ensure_loaded()), exactly once: independent artifacts load in
+parallel and concurrent callers wait for that single load. The LLM is loaded
+separately, so retrieval-only tools never need an API key. Paths are relative
+to the working directory; settings come from the environment (see
+backend/.env.example) and are read when the engine is created.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from chunk_store import ChunkStore
+from context_packer import pack_context, page_label
+from embedders import DEFAULT_ONNX_PATH, load_embedder
+from embedding_cache import embedding_cache
+from llm_client import LLMClient
+from reranker import CrossEncoderReranker
+from vector_index import load_index, override_search_params
+
+LLM_MODEL = "gemini-2.5-flash"
+WARMUP_QUERIES = [
+    "What are the main pests affecting cotton crops?",
+    "How to control pink bollworm in cotton?",
+]
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+class RAGEngine:
+    """Lazily loaded retrieval + generation pipeline shared by all entry points"""
+
+    def __init__(self, chunk_store_path: str = 'chunk_store', index_path: str = 'faiss_index.bin',
+                 bm25_path: str = 'bm25_index'):
+        self.chunk_store_path = chunk_store_path
+        self.index_path = index_path
+        self.bm25_path = bm25_path
+
+        # LLM backend: "gemini" (default) or "fake" for the local stand-in model
+        self.llm_backend = os.getenv("LLM_BACKEND", "gemini").strip().lower()
+        # LLM resilience: concurrency cap, per-call timeout, jittered retries of
+        # transient errors (429/5xx) and a circuit breaker
+        self.llm_settings = {
+            "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            "timeout": float(os.getenv("LLM_TIMEOUT_S", "6")),
+            "max_retries": int(os.getenv("LLM_MAX_RETRIES", "2")),
+            "backoff_base": float(os.getenv("LLM_BACKOFF_BASE_S", "0.5")),
+            "backoff_max": float(os.getenv("LLM_BACKOFF_MAX_S", "8")),
+            "failure_threshold": int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+            "reset_timeout": float(os.getenv("LLM_CIRCUIT_RESET_S", "30")),
+        }
+        # Memory-map the FAISS index read-only so multiple workers share one copy
+        self.faiss_mmap = _flag("FAISS_MMAP", "true")
+        # Query embedding backend: "torch" (SentenceTransformer) or "onnx" (int8 ONNX Runtime, no torch)
+        self.embedding_backend = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+        self.embedding_onnx_path = os.getenv("EMBEDDING_ONNX_PATH", DEFAULT_ONNX_PATH)
+        # Retrieval mode: "dense" (FAISS only) or "hybrid" (FAISS + BM25 fused with
+        # reciprocal rank fusion); hybrid fetches hybrid_fetch_k candidates from each side
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "dense").strip().lower()
+        self.hybrid_fetch_k = int(os.getenv("HYBRID_FETCH_K", "20"))
+        # Cross-encoder reranking: over-fetch rerank_fetch_k candidates, keep the best
+        # rerank_top_n, and fall back to retrieval order when it would exceed the budget
+        self.rerank_enabled = _flag("RERANK_ENABLED", "false")
+        self.rerank_model = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.rerank_fetch_k = int(os.getenv("RERANK_FETCH_K", "30"))
+        self.rerank_top_n = int(os.getenv("RERANK_TOP_N", "3"))
+        self.rerank_budget_ms = float(os.getenv("RERANK_BUDGET_MS", "200"))
+        self.rerank_cache_size = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+        # Context packing: merge overlapping hits from the same page and cap the prompt
+        # context at context_token_budget (estimated) tokens, filled in relevance order
+        self.context_packing = _flag("CONTEXT_PACKING", "true")
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+
+        self.warmup_queries = list(WARMUP_QUERIES)
+        # Context manager factory wrapped around pipeline stages (e.g. a latency histogram)
+        self.stage_timer = lambda stage: nullcontext()
+
+        self.chunk_store = None
+        self.index = None
+        self.index_meta: Dict = {}
+        self.bm25 = None
+        self.embedder = None
+        self.reranker = None
+        self.model = None
+        self.llm_client: Optional[LLMClient] = None
+        self.startup_timings: Dict[str, float] = {}
+
+        self._retrieval_lock = threading.Lock()
+        self._llm_lock = threading.Lock()
+        self._loop_lock = threading.Lock()
+        self._retrieval_ready = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # Loading
+
+    def load_llm(self, api_key: Optional[str] = None):
+        """The Gemini model (or the fake stand-in); api_key defaults to GEMINI_API_KEY"""
+        if self.llm_backend == "fake":
+            # Local stand-in LLM for offline development and testing
+            from fake_llm import FakeGenerativeModel
+            return FakeGenerativeModel()
+
+        api_key = api_key or os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+
+        api_key = api_key.strip()
+        if not api_key.startswith('AIza'):
+            raise ValueError(f"Invalid API key format. Key should start with 'AIza', got: '{api_key[:10]}...'")
+
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(LLM_MODEL)
+
+    def load_chunks(self) -> ChunkStore:
+        """Memory-map chunk texts and metadata; chunks are decoded only when retrieved"""
+        if not os.path.exists(self.chunk_store_path):
+            raise FileNotFoundError(f"{self.chunk_store_path} not found. Please run chunk_and_embed.py first")
+        return ChunkStore(self.chunk_store_path)
+
+    def load_index(self):
+        """Load the FAISS index with its recorded (or overridden) search parameters"""
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"{self.index_path} not found. Please run chunk_and_embed.py first")
+
+        loaded, self.index_meta = load_index(self.index_path, use_mmap=self.faiss_mmap)
+        env_names = {"nprobe": "FAISS_NPROBE", "efSearch": "FAISS_EF_SEARCH"}
+        overrides = {name: int(os.environ[env]) for name, env in env_names.items() if os.getenv(env)}
+        for name in override_search_params(loaded, self.index_meta, overrides):
+            print(f"⚠️ {env_names[name]} does not apply to this "
+                  f"{self.index_meta.get('index_type', 'flat')} index; ignoring it")
+        return loaded
+
+    def load_bm25(self) -> Optional[BM25Index]:
+        """Load the BM25 inverted index used by hybrid retrieval"""
+        if self.retrieval_mode != "hybrid":
+            return None
+        if not os.path.exists(self.bm25_path):
+            print(f"⚠️ {self.bm25_path} not found; hybrid retrieval falls back to dense search")
+            return None
+        try:
+            return BM25Index(self.bm25_path)
+        except ValueError as e:
+            print(f"⚠️ {e}; rebuild it with bm25_index.py. Hybrid retrieval falls back to dense search")
+            return None
+
+    def load_reranker(self):
+        """Load the cross-encoder used to rerank retrieval candidates"""
+        if not self.rerank_enabled:
+            return None
+        try:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(self.rerank_model, device='cpu', max_length=256)
+        except Exception as e:
+            print(f"⚠️ Could not load reranker '{self.rerank_model}' ({e}); using retrieval order")
+            return None
+        return CrossEncoderReranker(model, budget_ms=self.rerank_budget_ms, cache_size=self.rerank_cache_size)
+
+    def load_embedder(self):
+        """Load the sentence embedding model"""
+        return load_embedder(self.embedding_backend, self.embedding_onnx_path)
+
+    def _timed(self, phase: str, func):
+        start = time.perf_counter()
+        result = func()
+        self.startup_timings[phase] = time.perf_counter() - start
+        return result
+
+    def warmup(self):
+        """Run a real encode and search so the first user query doesn't pay for lazy initialization"""
+        query_embs = embedding_cache.encode_many(self.embedder, self.warmup_queries)
+        self.index.search(query_embs, 5)
+        if self.reranker is not None:
+            self.reranker.warmup(self.warmup_queries[0], self.texts[:self.rerank_fetch_k])
+
+    def ensure_retrieval(self) -> "RAGEngine":
+        """Load the retrieval artifacts in parallel and warm them up, once"""
+        if self._retrieval_ready:
+            return self
+        with self._retrieval_lock:
+            if self._retrieval_ready:
+                return self
+            loaders = {"chunks": self.load_chunks, "index": self.load_index, "bm25": self.load_bm25,
+                       "embedder": self.load_embedder, "reranker": self.load_reranker}
+            with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="rag-startup") as pool:
+                futures = {name: pool.submit(self._timed, name, loader) for name, loader in loaders.items()}
+                loaded = {name: future.result() for name, future in futures.items()}
+            self.chunk_store, self.index, self.bm25 = loaded["chunks"], loaded["index"], loaded["bm25"]
+            self.embedder, self.reranker = loaded["embedder"], loaded["reranker"]
+            self._timed("warmup", self.warmup)
+            self._retrieval_ready = True
+        return self
+
+    def ensure_llm(self, api_key: Optional[str] = None) -> LLMClient:
+        """The shared LLM client, created on first use (api_key only matters then)"""
+        if self.llm_client is not None:
+            return self.llm_client
+        with self._llm_lock:
+            if self.llm_client is None:
+                self.model = self._timed("llm", lambda: self.load_llm(api_key))
+                self.llm_client = LLMClient(self.model, **self.llm_settings)
+        return self.llm_client
+
+    def ensure_loaded(self, llm: bool = True) -> "RAGEngine":
+        """Load everything not loaded yet, the LLM alongside the retrieval artifacts"""
+        start = time.perf_counter()
+        if llm and self.llm_client is None:
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-startup") as pool:
+                llm_future = pool.submit(self.ensure_llm)
+                self.ensure_retrieval()
+                llm_future.result()
+        else:
+            self.ensure_retrieval()
+        self.startup_timings.setdefault("total", time.perf_counter() - start)
+        return self
+
+    @property
+    def ready(self) -> bool:
+        return self._retrieval_ready
+
+    @property
+    def texts(self):
+        return self.chunk_store.texts if self.chunk_store is not None else None
+
+    @property
+    def metadatas(self):
+        return self.chunk_store.metadatas if self.chunk_store is not None else None
+
+    # Retrieval
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, reusing the shared embedding cache"""
+        self.ensure_retrieval()
+        return embedding_cache.encode(self.embedder, query)
+
+    def embed_many(self, queries: List[str]) -> np.ndarray:
+        """Embed several queries with one encode call for all cache misses"""
+        self.ensure_retrieval()
+        return embedding_cache.encode_many(self.embedder, queries)
+
+    def search_many(self, query_embs: np.ndarray, k: int = 5,
+                    queries: Optional[List[str]] = None) -> List[List[Dict]]:
+        """
+        Search the FAISS index for several query embeddings in one call.
+        In hybrid mode (and when the query texts are given) each row is fused
+        with BM25 results using reciprocal rank fusion. With reranking enabled,
+        more candidates are fetched and the cross-encoder picks the best ones.
+        """
+        self.ensure_retrieval()
+        texts, metadatas = self.texts, self.metadatas
+
+        hybrid = self.retrieval_mode == "hybrid" and self.bm25 is not None and queries is not None
+        rerank = self.reranker is not None and queries is not None
+        candidate_k = max(k, self.rerank_fetch_k) if rerank else k
+        fetch_k = max(candidate_k, self.hybrid_fetch_k) if hybrid else candidate_k
+        D, I = self.index.search(np.ascontiguousarray(query_embs, dtype=np.float32), fetch_k)
+        # The index returns chunk ids; from here on results refer to chunk store rows
+        I = self.chunk_store.rows_for_ids(I)
+
+        all_results = []
+        for row in range(len(I)):
+            results = []
+            if hybrid:
+                _, lexical_ids = self.bm25.search(queries[row], fetch_k)
+                lexical_ids = self.chunk_store.rows_for_ids(lexical_ids)
+                distances = {int(idx): float(dist) for dist, idx in zip(D[row], I[row]) if idx >= 0}
+                for idx, score in reciprocal_rank_fusion([I[row], lexical_ids], candidate_k):
+                    if 0 <= idx < len(texts):
+                        results.append({
+                            'id': idx,
+                            'text': texts[idx],
+                            'metadata': metadatas[idx],
+                            'distance': distances.get(idx),
+                            'score': score
+                        })
+            else:
+                for idx_pos, idx in enumerate(I[row]):
+                    if 0 <= idx < len(texts):
+                        results.append({
+                            'id': int(idx),
+                            'text': texts[idx],
+                            'metadata': metadatas[idx],
+                            'distance': float(D[row][idx_pos])
+                        })
+            all_results.append(results)
+
+        if rerank:
+            with self.stage_timer("rerank"):
+                all_results = self.reranker.rerank_many(queries, all_results,
+                                                        top_n=min(k, self.rerank_top_n), fallback_k=k)
+
+        return all_results
+
+    def search(self, query_emb: np.ndarray, k: int = 5, query: Optional[str] = None) -> List[Dict]:
+        """Search the FAISS index with a precomputed query embedding"""
+        return self.search_many(query_emb, k, [query] if query is not None else None)[0]
+
+    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
+        """Retrieve relevant chunks"""
+        try:
+            return self.search(self.embed_query(query), k, query)
+        except Exception as e:
+            print(f"Retrieval error: {e}")
+            raise
+
+    def index_stats(self) -> Optional[Dict]:
+        """Describe the loaded FAISS index"""
+        if self.index is None:
+            return None
+        meta = self.index_meta
+        return {
+            "type": type(self.index).__name__,
+            "index_type": meta.get('index_type'),
+            "search_params": meta.get('search_params'),
+            "encoding": meta.get('encoding', 'none'),
+            "pca_dim": meta.get('pca_dim'),
+            "compression_ratio": meta.get('compression_ratio'),
+            "retrieval_mode": "hybrid" if self.retrieval_mode == "hybrid" and self.bm25 is not None else "dense",
+            "vectors": self.index.ntotal,
+            "dimension": self.index.d,
+            "file_bytes": os.path.getsize(self.index_path) if os.path.exists(self.index_path) else None,
+            "mmap": self.faiss_mmap
+        }
+
+    # Prompting and generation
+
+    def pack_context(self, results: List[Dict], pack: Optional[bool] = None,
+                     separator: str = "\n\n") -> Tuple[str, Optional[Dict]]:
+        """
+        Prompt context with [Source p.X] citations, plus packing stats (None when not packed).
+        pack defaults to CONTEXT_PACKING; pass False to keep every retrieved chunk whole,
+        each followed by separator.
+        """
+        if self.context_packing if pack is None else pack:
+            return pack_context(results, self.context_token_budget)
+        context = ""
+        for r in results:
+            context += f"[Source p.{page_label(r['metadata'])}] {r['text']}{separator}"
+        return context, None
+
+    def format_context_with_citations(self, results: List[Dict], pack: Optional[bool] = None,
+                                      separator: str = "\n\n") -> str:
+        """Format retrieved context, packed into the token budget unless packing is disabled"""
+        return self.pack_context(results, pack, separator)[0]
+
+    def build_prompt(self, query: str, context: str, conversation_context: Optional[List[Dict]] = None,
+                     summary: str = "", grounded_only: bool = False) -> str:
+        """
+        Build the LLM prompt from retrieved context and conversation history.
+        grounded_only restricts the answer to the context, with no conversation guideline (app.py).
+        """
+        # Build conversation history context
+        conversation_history = ""
+        if summary:
+            conversation_history = f"\n\nEarlier in this conversation (summary):\n{summary}\n"
+        if conversation_context and len(conversation_context) > 0:
+            conversation_history += "\n\nPrevious conversation:\n"
+            for msg in conversation_context[-3:]:  # Use last 3 messages for context
+                role = msg.get('role', 'user')
+                content = msg.get('content', '')
+                conversation_history += f"{role.upper()}: {content}\n"
+
+        source = "ONLY the provided context" if grounded_only else "the provided context"
+        history_guideline = "" if grounded_only else \
+            "- Consider the conversation history to provide contextually relevant answers\n"
+
+        return f"""You are a Cotton Pest and Disease Management expert assistant. Answer the following question using {source} from the ICAR-CICR Advisory document.
+{conversation_history}
+Guidelines:
+- Provide accurate, actionable information for cotton farmers
+- Cite sources using [Source p.X] format for every fact
+- If the context doesn't contain the answer, clearly state that
+- Be concise but comprehensive
+- Use bullet points for multiple items
+- Focus on practical recommendations
+{history_guideline}
+Context:
+{context}
+
+Question: {query}
+
+Answer:"""
+
+    async def generate(self, prompt: str) -> str:
+        """Generate through the shared LLM client (concurrency limit, timeout, retries, circuit breaker)"""
+        return await self.ensure_llm().generate(prompt)
+
+    def run_sync(self, coro):
+        """Run a coroutine on the engine's background event loop, for synchronous callers"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="rag-engine-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+
+_engine: Optional[RAGEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RAGEngine:
+    """The process-wide engine; created (not loaded) on the first call, after the caller's load_dotenv()"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RAGEngine()
+    return _engine
@@ -0,0 +1,136 @@
+"""
+Cross-encoder reranking with a latency budget
+Rescores over-fetched retrieval candidates with a small cross-encoder in one
+batched forward pass and keeps the best few, so fewer (but more relevant)
+chunks go into the prompt. Scores are cached per (query, chunk) pair.
+
+The time budget is enforced while scoring: uncached pairs are scored in small
+chunks, and scoring stops once the budget is spent or the next chunk (by the
+running per-pair cost estimate) would not fit. A call therefore overruns the
+budget by at most one chunk. Queries left with unscored candidates keep their
+original retrieval order; the scores computed so far are still cached.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+from embedding_cache import normalize_query
+
+
+class CrossEncoderReranker:
+    """Budgeted cross-encoder reranking of retrieval results"""
+
+    def __init__(self, model, budget_ms: float = 200, cache_size: int = 4096, batch_size: int = 64,
+                 chunk_size: int = 8):
+        self.model = model
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.reranked = 0
+        self.fallbacks = 0
+        self.over_budget = 0
+        self.hits = 0
+        self.misses = 0
+        self._pair_ms = None
+        self._scores: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _score(self, pairs: List[tuple]) -> List[float]:
+        start = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        per_pair = (time.perf_counter() - start) * 1000 / len(pairs)
+        with self._lock:
+            self._pair_ms = per_pair if self._pair_ms is None else 0.8 * self._pair_ms + 0.2 * per_pair
+        return [float(score) for score in scores]
+
+    def _score_within_budget(self, pairs: List[tuple]) -> List[float]:
+        """Score pairs chunk by chunk, stopping at the budget; returns the scores computed so far"""
+        start = time.perf_counter()
+        scores: List[float] = []
+        for i in range(0, len(pairs), self.chunk_size):
+            chunk = pairs[i:i + self.chunk_size]
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                chunk_ms = len(chunk) * (self._pair_ms or 0.0)
+            if elapsed_ms + chunk_ms > self.budget_ms:
+                with self._lock:
+                    self.over_budget += 1
+                break
+            scores.extend(self._score(chunk))
+        return scores
+
+    def warmup(self, query: str, passages: Sequence[str]):
+        """Run one forward pass to load the model and calibrate the per-pair cost"""
+        if passages:
+            self._score([(query, passage) for passage in passages])
+
+    def rerank_many(self, queries: Sequence[str], candidates: List[List[Dict]],
+                    top_n: int, fallback_k: int) -> List[List[Dict]]:
+        """
+        Rerank each query's candidates (dicts with 'id' and 'text').
+        Returns the top_n by cross-encoder score, or the first fallback_k in
+        retrieval order for queries whose candidates could not all be scored
+        within the time budget.
+        """
+        keys = [normalize_query(query) for query in queries]
+        scores: Dict[tuple, float] = {}
+        missing = {}
+        with self._lock:
+            for query, key, results in zip(queries, keys, candidates):
+                for result in results:
+                    pair_key = (key, result['id'])
+                    score = self._scores.get(pair_key)
+                    if score is not None:
+                        self._scores.move_to_end(pair_key)
+                        scores[pair_key] = score
+                        self.hits += 1
+                    elif pair_key not in missing:
+                        missing[pair_key] = (query, result['text'])
+                        self.misses += 1
+            estimate_ms = len(missing) * self._pair_ms if self._pair_ms is not None else 0.0
+
+        if missing and estimate_ms > self.budget_ms:
+            with self._lock:
+                self.fallbacks += len(candidates)
+                # Let the estimate recover so a transient slowdown doesn't disable reranking for good
+                self._pair_ms *= 0.9
+            return [results[:fallback_k] for results in candidates]
+
+        if missing:
+            computed = self._score_within_budget(list(missing.values()))
+            with self._lock:
+                for pair_key, score in zip(missing, computed):
+                    scores[pair_key] = score
+                    self._scores[pair_key] = score
+                    self._scores.move_to_end(pair_key)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        reranked = []
+        fallbacks = 0
+        for key, results in zip(keys, candidates):
+            if any((key, r['id']) not in scores for r in results):
+                reranked.append(results[:fallback_k])
+                fallbacks += 1
+                continue
+            ordered = sorted(results, key=lambda r: -scores[(key, r['id'])])[:top_n]
+            reranked.append([dict(r, rerank_score=scores[(key, r['id'])]) for r in ordered])
+        with self._lock:
+            self.reranked += len(candidates) - fallbacks
+            self.fallbacks += fallbacks
+        return reranked
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "reranked": self.reranked,
+                "fallbacks": self.fallbacks,
+                "over_budget": self.over_budget,
+                "budget_ms": self.budget_ms,
+                "pair_cost_ms": round(self._pair_ms, 3) if self._pair_ms is not None else None,
+                "cache_size": len(self._scores),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,235 @@
+"""
+Server-side conversation sessions
+Clients send a session id instead of resending the conversation on every turn.
+Each session keeps the last few messages (truncated to a fixed length) and a
+rolling summary of older turns that is itself capped in size, so the history
+added to the prompt stays roughly constant however long the conversation runs.
+
+Summaries are extractive (each folded turn becomes its question and the first
+sentence of its answer), which costs no LLM calls. Follow-up questions like
+"what is its dose?" are rewritten for retrieval by appending the topic of the
+previous question, since the embedding of the bare follow-up finds nothing.
+
+The store is an in-memory LRU with a TTL. With a spill directory, sessions
+evicted for space are written there as JSON and reloaded on their next request.
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+# Topic terms carried over from the previous question into a rewritten follow-up
+MAX_TOPIC_TERMS = 6
+FOLLOW_UP_PATTERN = re.compile(
+    r"^(and|also|what about|how about|then|so|but)\b|\b(it|its|they|them|their|this|that|these|those|same|such|above)\b",
+    re.IGNORECASE)
+STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "what", "which", "when", "where", "who", "how", "why",
+    "does", "did", "can", "could", "should", "would", "will", "with", "from", "into", "about", "this",
+    "that", "these", "those", "there", "their", "them", "they", "its", "any", "all", "some", "more",
+    "most", "much", "many", "also", "then", "than", "you", "your", "our", "has", "have", "had", "use",
+    "used", "using", "tell", "please", "give", "list", "explain", "describe", "work", "works", "against",
+    "best", "main", "cotton", "crop", "crops",
+}
+
+
+class Session:
+    """One conversation: recent messages, a summary of older ones, and the last retrieval query"""
+
+    def __init__(self, session_id: str, messages: Optional[List[Dict]] = None, summary: str = "",
+                 last_query: str = "", updated_at: Optional[float] = None):
+        self.id = session_id
+        self.messages = messages or []
+        self.summary = summary
+        self.last_query = last_query
+        self.updated_at = updated_at or time.time()
+
+    def to_dict(self) -> Dict:
+        return {"id": self.id, "messages": self.messages, "summary": self.summary,
+                "last_query": self.last_query, "updated_at": self.updated_at}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        return cls(data["id"], data["messages"], data["summary"], data["last_query"], data["updated_at"])
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    text = re.sub(r"\[Source p\.[^\]]*\]", "", text)
+    text = " ".join(text.replace("*", "").split())
+    match = re.search(r"(?<=[.!?])\s", text)
+    sentence = text[:match.start()] if match else text
+    return sentence[:max_chars].rstrip() + ("…" if len(sentence) > max_chars else "")
+
+
+def _content_terms(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9][a-z0-9\-]+", text.lower())
+    return list(dict.fromkeys(w for w in words if len(w) > 2 and w not in STOPWORDS))
+
+
+def standalone_query(query: str, session: Optional[Session]) -> str:
+    """Rewrite a follow-up question into a standalone query for retrieval"""
+    if session is None or not session.last_query:
+        return query
+    is_follow_up = len(query.split()) <= 3 or FOLLOW_UP_PATTERN.search(query)
+    if not is_follow_up:
+        return query
+    present = set(_content_terms(query))
+    topic = [term for term in _content_terms(session.last_query) if term not in present][:MAX_TOPIC_TERMS]
+    return f"{query} ({' '.join(topic)})" if topic else query
+
+
+class SessionStore:
+    """Bounded LRU/TTL store of conversation sessions with optional disk spill"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400, recent_messages: int = 3,
+                 message_chars: int = 600, summary_chars: int = 1200, spill_dir: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.recent_messages = recent_messages
+        self.message_chars = message_chars
+        self.summary_chars = summary_chars
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.created = 0
+        self.spilled = 0
+        self.restored = 0
+        self.expired = 0
+        self.missed = 0
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _spill_path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _expired(self, session: Session) -> bool:
+        return time.time() - session.updated_at > self.ttl
+
+    def _restore(self, session_id: str) -> Optional[Session]:
+        """Reload a spilled session (the file is removed; it lives in memory again)"""
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(session_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                session = Session.from_dict(json.load(f))
+            os.remove(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        if self._expired(session):
+            self.expired += 1
+            return None
+        self.restored += 1
+        return session
+
+    def _spill(self, session: Session):
+        tmp_path = self._spill_path(session.id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, self._spill_path(session.id))
+        self.spilled += 1
+
+    def _lookup(self, session_id: Optional[str]) -> Optional[Session]:
+        if not session_id or not SESSION_ID_PATTERN.match(session_id):
+            return None
+        session = self._sessions.get(session_id)
+        if session is not None and self._expired(session):
+            del self._sessions[session_id]
+            self.expired += 1
+            session = None
+        if session is None:
+            session = self._restore(session_id)
+        return session
+
+    def find(self, session_id: Optional[str]) -> Optional[Session]:
+        """
+        The session with this id, or None if this process does not hold it
+        (never created here, expired, evicted without spill, or lost on restart)
+        """
+        with self._lock:
+            session = self._lookup(session_id)
+            if session is None:
+                self.missed += 1
+                return None
+            self._put(session)
+            return session
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """The session with this id, or a new one (with a fresh id) if it is unknown or expired"""
+        with self._lock:
+            session = self._lookup(session_id)
+            if session is None:
+                session = Session(uuid.uuid4().hex)
+                self.created += 1
+            self._put(session)
+            return session
+
+    def _put(self, session: Session):
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.maxsize:
+            _, evicted = self._sessions.popitem(last=False)
+            if self.spill_dir and not self._expired(evicted):
+                self._spill(evicted)
+
+    def _append(self, session: Session, role: str, content: str):
+        content = content.strip()
+        if len(content) > self.message_chars:
+            content = content[:self.message_chars].rstrip() + " …"
+        session.messages.append({"role": role, "content": content})
+        # Fold the oldest messages into the rolling summary
+        folded = []
+        while len(session.messages) > self.recent_messages:
+            message = session.messages.pop(0)
+            prefix = "Q" if message["role"] == "user" else "A"
+            folded.append(f"{prefix}: {_first_sentence(message['content'], 160)}")
+        if folded:
+            lines = (session.summary.splitlines() if session.summary else []) + folded
+            while lines and len("\n".join(lines)) > self.summary_chars:
+                lines.pop(0)
+            session.summary = "\n".join(lines)
+
+    def record(self, session: Session, query: str, answer: str, search_query: Optional[str] = None):
+        """Add a completed turn to the session"""
+        with self._lock:
+            self._append(session, "user", query)
+            self._append(session, "assistant", answer)
+            session.last_query = search_query or query
+            session.updated_at = time.time()
+            self._put(session)
+
+    def reset(self, session: Session, messages: List[Dict]):
+        """Replace the session's history with messages supplied by the client"""
+        with self._lock:
+            session.messages, session.summary, session.last_query = [], "", ""
+            for message in messages:
+                role, content = message.get("role", "user"), message.get("content", "")
+                if content:
+                    self._append(session, role, content)
+                    if role == "user":
+                        session.last_query = content
+            session.updated_at = time.time()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+            if self.spill_dir and SESSION_ID_PATTERN.match(session_id) and os.path.exists(self._spill_path(session_id)):
+                os.remove(self._spill_path(session_id))
+                found = True
+            return found
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "maxsize": self.maxsize,
+            "created": self.created,
+            "spilled": self.spilled,
+            "restored": self.restored,
+            "expired": self.expired,
+            "missed": self.missed,
+        }
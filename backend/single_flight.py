@@ -0,0 +1,105 @@
+"""
+Single-flight coalescing of identical in-flight requests
+Concurrent callers with the same key share one computation: the first caller
+starts it, later callers wait for the same result. Streams are shared too:
+every subscriber receives all items produced so far, then each new one as it
+arrives, so a caller joining mid-stream still gets the complete answer.
+
+The shared work runs as its own task, so one caller going away doesn't cancel
+it for the others; it is cancelled only once every caller has left.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # Stream state
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def publish(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def leave(self):
+        self.waiters -= 1
+        if self.waiters == 0 and not self.task.done():
+            self.task.cancel()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls (or streams) with the same key into one in-flight computation"""
+
+    def __init__(self, name: str = "flight"):
+        self.name = name
+        self.started = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def _join(self, key: Hashable, start: Callable[[_Flight], Awaitable]) -> _Flight:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.get_running_loop().create_task(start(flight))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self._flights[key] = flight
+            self.started += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        return flight
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]) -> Any:
+        """Run func() unless a call with the same key is in flight, and return its result"""
+        flight = self._join(key, lambda _: func())
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.leave()
+
+    async def stream(self, key: Hashable, func: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Iterate func() unless a stream with the same key is in flight, and replay its items"""
+        flight = self._join(key, lambda f: self._produce(f, func))
+        try:
+            position = 0
+            while True:
+                if position < len(flight.items):
+                    position += 1
+                    yield flight.items[position - 1]
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.changed.wait()
+        finally:
+            flight.leave()
+
+    async def _produce(self, flight: _Flight, func: Callable[[], AsyncIterator]):
+        items = func()
+        try:
+            async for item in items:
+                flight.items.append(item)
+                flight.publish()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.publish()
+            await items.aclose()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
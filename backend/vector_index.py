@@ -0,0 +1,309 @@
+"""
+FAISS index building and loading
+Builds exact or approximate (IVF-Flat, HNSW, IVF-PQ) indexes, records the
+index type and search parameters in a JSON sidecar next to the index file,
+and loads indexes back with those parameters applied.
+
+Stored vectors can be compressed: float16 or 8-bit scalar quantization
+(SQfp16 / SQ8 codes instead of float32), optionally after a PCA projection to
+fewer dimensions. The PCA matrix is part of the index (IndexPreTransform), so
+queries are projected the same way at search time without callers changing.
+
+Indexes built with chunk ids are ID-mapped (IVF natively, flat and HNSW via
+IndexIDMap2), so incremental ingestion can add and remove individual
+documents' vectors without re-encoding the rest of the corpus.
+
+Loading supports reading the index read-only through mmap so that several
+worker processes share one physical copy of the vectors via the OS page
+cache instead of each holding a private copy on its heap.
+"""
+import json
+import math
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+VECTOR_ENCODINGS = {'none': 'Flat', 'fp16': 'SQfp16', 'sq8': 'SQ8'}
+
+
+def meta_path_for(index_path: str) -> str:
+    """Sidecar metadata file for an index, e.g. faiss_index.bin -> faiss_index.meta.json"""
+    return os.path.splitext(index_path)[0] + '.meta.json'
+
+
+def default_nlist(n: int) -> int:
+    """IVF list count: ~4*sqrt(n), keeping at least 39 training points per list"""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def index_factory_string(index_type: str, n: int, dim: int, nlist: Optional[int] = None,
+                         hnsw_m: int = 32, pq_m: Optional[int] = None, encoding: str = 'none',
+                         pca_dim: Optional[int] = None) -> str:
+    """Translate an index type, vector encoding and corpus size into a faiss index_factory description"""
+    if encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}'. Choose from: {', '.join(VECTOR_ENCODINGS)}")
+    prefix = ""
+    if pca_dim:
+        if not 0 < pca_dim < dim:
+            raise ValueError(f"PCA dimension must be between 1 and {dim - 1}, got {pca_dim}")
+        if 0 < n < pca_dim:
+            raise ValueError(f"PCA to {pca_dim} dimensions needs at least {pca_dim} vectors, got {n}")
+        prefix, dim = f"PCA{pca_dim},", pca_dim
+    codes = VECTOR_ENCODINGS[encoding]
+
+    if index_type == 'flat':
+        return prefix + codes
+    if index_type == 'hnsw':
+        return prefix + (f"HNSW{hnsw_m}" if encoding == 'none' else f"HNSW{hnsw_m}_{codes}")
+    nlist = nlist or default_nlist(n)
+    if index_type == 'ivf_flat':
+        return prefix + f"IVF{nlist},{codes}"
+    if index_type == 'ivf_pq':
+        if encoding != 'none':
+            raise ValueError("ivf_pq already compresses vectors with product quantization; use encoding 'none'")
+        pq_m = pq_m or next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+        # Each sub-quantizer needs at least 2**nbits training points
+        nbits = max(1, min(8, int(math.log2(max(n, 2)))))
+        return prefix + f"IVF{nlist},PQ{pq_m}x{nbits}"
+    raise ValueError(f"Unknown index type '{index_type}'. Choose from: {', '.join(INDEX_TYPES)}")
+
+
+def needs_training(index_type: str, encoding: str = 'none', pca_dim: Optional[int] = None) -> bool:
+    """Whether the index must be trained on sample vectors before anything can be added"""
+    return index_type in ('ivf_flat', 'ivf_pq') or encoding == 'sq8' or bool(pca_dim)
+
+
+def new_index(index_type: str, n: int, dim: int, nlist: Optional[int] = None, hnsw_m: int = 32,
+              pq_m: Optional[int] = None, nprobe: Optional[int] = None, ef_search: int = 64,
+              id_mapped: bool = False, encoding: str = 'none', pca_dim: Optional[int] = None):
+    """
+    Create an empty (untrained) index of the requested type sized for n vectors.
+    Returns (index, meta) where meta records the type, encoding and search parameters.
+    """
+    factory = index_factory_string(index_type, n, dim, nlist, hnsw_m, pq_m, encoding, pca_dim)
+    if id_mapped and index_type in ('flat', 'hnsw'):
+        factory = f"IDMap2,{factory}"
+    index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+
+    meta = {
+        'index_type': index_type,
+        'factory': factory,
+        'metric': 'l2',
+        'dimension': dim,
+        'encoding': encoding,
+        'pca_dim': pca_dim,
+        'ntotal': 0,
+        'id_mapped': id_mapped,
+        'search_params': {},
+    }
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        list_count = faiss.extract_index_ivf(index).nlist
+        meta['search_params']['nprobe'] = min(list_count, nprobe or max(1, list_count // 8))
+    elif index_type == 'hnsw':
+        meta['search_params']['efSearch'] = ef_search
+    configure_search(index, meta)
+    return index, meta
+
+
+def build_index(embeddings: np.ndarray, index_type: str = 'flat', nlist: Optional[int] = None,
+                hnsw_m: int = 32, pq_m: Optional[int] = None, nprobe: Optional[int] = None,
+                ef_search: int = 64, ids: Optional[Sequence[int]] = None, encoding: str = 'none',
+                pca_dim: Optional[int] = None):
+    """
+    Train and fill an index of the requested type.
+    With ids, vectors are stored under those chunk ids instead of their position.
+    Returns (index, meta) where meta records the type and search parameters.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, dim = embeddings.shape
+
+    start = time.perf_counter()
+    index, meta = new_index(index_type, n, dim, nlist, hnsw_m, pq_m, nprobe, ef_search,
+                            id_mapped=ids is not None, encoding=encoding, pca_dim=pca_dim)
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is not None:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(embeddings)
+    meta['ntotal'] = int(index.ntotal)
+    meta['build_seconds'] = round(time.perf_counter() - start, 3)
+    return index, meta
+
+
+def configure_search(index, meta: Dict):
+    """Apply recorded search parameters (nprobe / efSearch) to a loaded index"""
+    params = faiss.ParameterSpace()
+    for name, value in (meta or {}).get('search_params', {}).items():
+        params.set_index_parameter(index, name, value)
+
+
+def override_search_params(index, meta: Dict, overrides: Dict[str, int]) -> List[str]:
+    """
+    Apply search parameter overrides to a loaded index and record them in its
+    metadata. Returns the names that don't apply to this index type (e.g.
+    nprobe on HNSW); those are left unset.
+    """
+    params = meta.setdefault('search_params', {})
+    space = faiss.ParameterSpace()
+    ignored = []
+    for name, value in overrides.items():
+        try:
+            space.set_index_parameter(index, name, value)
+        except RuntimeError:
+            ignored.append(name)
+            continue
+        params[name] = value
+    return ignored
+
+
+def train_sample_size(index, n: int) -> int:
+    """Vectors to train an index on: plenty per IVF list, capped so memory stays bounded"""
+    try:
+        nlist = faiss.extract_index_ivf(index).nlist
+    except RuntimeError:
+        nlist = 0  # PCA / SQ8 only need statistics of the distribution
+    return min(n, max(65536, 64 * nlist))
+
+
+def add_vectors(index, embeddings: np.ndarray, ids: Sequence[int]):
+    """Append vectors to an ID-mapped index under the given chunk ids"""
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(embeddings, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+
+
+def remove_vectors(index, ids: Sequence[int], meta: Dict):
+    """
+    Remove vectors by chunk id and return the updated index.
+    HNSW graphs cannot delete in place, so they are rebuilt from their stored
+    vectors minus the removed ids; nothing is re-embedded. Compressed vectors
+    are decoded and re-encoded with the same trained PCA / quantizer, which
+    maps them back to the same codes.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids):
+        return index
+    if meta.get('index_type') != 'hnsw':
+        index.remove_ids(faiss.IDSelectorBatch(ids))
+        return index
+
+    stored_ids = faiss.vector_to_array(index.id_map)
+    inner = faiss.downcast_index(index.index)
+    vectors = inner.reconstruct_n(0, inner.ntotal)
+    keep = ~np.isin(stored_ids, ids)
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    add_vectors(rebuilt, vectors[keep], stored_ids[keep])
+    configure_search(rebuilt, meta)
+    return rebuilt
+
+
+def evaluate_index(index, vector_batches: Callable[[], Iterable[Tuple[np.ndarray, np.ndarray]]], rows: int,
+                   k: int = 5, n_queries: int = 200, seed: int = 0) -> Dict:
+    """
+    Recall@k against exact search over the uncompressed float32 vectors, and
+    single-query latency. Queries are sampled from the corpus vectors themselves.
+    vector_batches() yields the corpus (rows vectors in total) as (vectors, ids)
+    batches, with the ids stored in the index. It is read twice, for the
+    queries and then for exact neighbours merged batch by batch, so memory
+    stays bounded by one batch rather than growing with the corpus.
+    """
+    rng = np.random.default_rng(seed)
+    picks = np.sort(rng.choice(rows, size=min(n_queries, rows), replace=False))
+    queries, seen = [], 0
+    for vectors, _ in vector_batches():
+        lo, hi = np.searchsorted(picks, [seen, seen + len(vectors)])
+        queries.append(np.asarray(vectors[picks[lo:hi] - seen], dtype=np.float32))
+        seen += len(vectors)
+    queries = np.ascontiguousarray(np.concatenate(queries))
+    k = min(k, rows)
+
+    heap = faiss.ResultHeap(len(queries), k)
+    for vectors, ids in vector_batches():
+        exact = faiss.IndexFlatL2(queries.shape[1])
+        exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        D, I = exact.search(queries, min(k, len(vectors)))
+        heap.add_result(D, np.where(I >= 0, np.asarray(ids, dtype=np.int64)[I], -1))
+    heap.finalize()
+    truth = heap.I
+
+    latencies = []
+    found = np.empty_like(truth)
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        _, I = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - t0)
+        found[i] = I[0]
+
+    hits = sum(len(set(truth[i]) & set(found[i])) for i in range(len(queries)))
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'k': k,
+        'queries': len(queries),
+        f'recall@{k}': round(hits / (len(queries) * k), 4),
+        'latency_p50_ms': round(float(np.percentile(latencies_ms, 50)), 4),
+        'latency_p95_ms': round(float(np.percentile(latencies_ms, 95)), 4),
+    }
+
+
+def write_index(index, meta: Dict, index_path: str):
+    """
+    Write the index and its metadata sidecar, recording its size against raw float32 vectors.
+    Both files are written next to their target and swapped in with os.replace, so
+    servers that memory-mapped the old index keep their mapping instead of
+    crashing (SIGBUS) when the file is truncated underneath them.
+    """
+    tmp_index_path = index_path + '.tmp'
+    faiss.write_index(index, tmp_index_path)
+    meta['index_bytes'] = os.path.getsize(tmp_index_path)
+    raw_bytes = int(index.ntotal) * index.d * 4
+    meta['compression_ratio'] = round(raw_bytes / meta['index_bytes'], 2) if raw_bytes else None
+    meta_path = meta_path_for(index_path)
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_index_path, index_path)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def load_index_meta(index_path: str) -> Dict:
+    """Read the metadata sidecar; indexes built before it existed are exact flat indexes"""
+    path = meta_path_for(index_path)
+    if not os.path.exists(path):
+        return {'index_type': 'flat', 'search_params': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def mmap_supported() -> bool:
+    """Whether this faiss build can memory-map flat-code indexes"""
+    return hasattr(faiss, 'IO_FLAG_MMAP_IFC')
+
+
+def read_index(path: str, use_mmap: bool = False):
+    """
+    Load a FAISS index.
+    With use_mmap, vector codes stay in the mapped file (shared, read-only)
+    rather than being copied into process memory. Falls back to a regular
+    read when the faiss build or index type does not support it.
+    """
+    if use_mmap:
+        if not mmap_supported():
+            print("⚠️ This faiss version cannot memory-map indexes; loading into memory")
+        else:
+            try:
+                return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError as e:
+                print(f"⚠️ Memory-mapped load failed ({e}); loading into memory")
+    return faiss.read_index(path)
+
+
+def load_index(path: str, use_mmap: bool = False):
+    """Load an index and apply the search parameters recorded when it was built"""
+    index = read_index(path, use_mmap=use_mmap)
+    meta = load_index_meta(path)
+    configure_search(index, meta)
+    return index, meta
@@ -1,46 +1,386 @@
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
-import faiss
+import argparse
+import itertools
+import json
 import numpy as np
-import pickle
 import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
+# Shared storage modules live in backend/ so the API stays deployable on its own
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from chunk_store import ChunkStore, ChunkStoreWriter, update_chunk_store
+from vector_index import (INDEX_TYPES, VECTOR_ENCODINGS, add_vectors, evaluate_index, load_index,
+                          load_index_meta, needs_training, new_index, remove_vectors, train_sample_size,
+                          write_index)
+from bm25_index import bm25_index_current, build_bm25_index, update_bm25_index
+from embedders import EMBEDDING_MODEL, load_embedder
+from ingest import (IngestCheckpoint, VectorStore, find_sources, load_manifest, new_manifest, plan_changes,
+                    record_file, save_manifest, stale_ids)
+
 load_dotenv()
 
 # Force CPU usage to avoid CUDA compatibility issues
 os.environ['CUDA_VISIBLE_DEVICES'] = ''
 
-# Load PDF
-doc_path = os.getenv('DOCUMENT_PATH', './document/ICAR-CICR_Advisory Pest and Disease Management 2024.pdf')
-loader = PyPDFLoader(doc_path)
-documents = loader.load()
+MANIFEST_PATH = 'ingest_manifest.json'
+CHECKPOINT_PATH = 'ingest_checkpoint'
+VECTORS_PATH = 'ingest_vectors'
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch').strip().lower()
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
 
-# Chunk documents
 text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=100,
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
     length_function=len,
 )
-chunks = text_splitter.create_documents([doc.page_content for doc in documents],
-                                         metadatas=[doc.metadata for doc in documents])
 
-# Load embedding model
-embedder = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
 
-# Create embeddings
-texts = [chunk.page_content for chunk in chunks]
-metadatas = [chunk.metadata for chunk in chunks]
-embeddings = embedder.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chunk the advisory PDFs, embed the chunks and build or update the FAISS index")
+    parser.add_argument('--docs', nargs='+', default=[os.getenv('DOCUMENT_PATH', './document')],
+                        help="PDF files or directories to ingest (default: DOCUMENT_PATH or ./document)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Ignore the ingest manifest and any interrupted build, and re-embed every document")
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help="Processes parsing and splitting PDFs")
+    parser.add_argument('--batch-size', type=int, default=256, help="Chunks embedded per batch")
+    parser.add_argument('--checkpoint-every', type=int, default=10,
+                        help="Batches between checkpoints of an interrupted build")
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default=os.getenv('INDEX_TYPE', 'flat'),
+                        help="flat (exact), ivf_flat, hnsw or ivf_pq (default: flat)")
+    parser.add_argument('--nlist', type=int, help="IVF lists (default: ~4*sqrt(n))")
+    parser.add_argument('--nprobe', type=int, help="IVF lists probed per query (default: nlist/8)")
+    parser.add_argument('--hnsw-m', type=int, default=32, help="HNSW graph degree")
+    parser.add_argument('--ef-search', type=int, default=64, help="HNSW search breadth")
+    parser.add_argument('--pq-m', type=int, help="PQ sub-quantizers for ivf_pq (must divide the dimension)")
+    parser.add_argument('--encoding', choices=list(VECTOR_ENCODINGS), default=os.getenv('VECTOR_ENCODING', 'none'),
+                        help="How vectors are stored: none (float32), fp16 or sq8 (8-bit scalar quantization)")
+    parser.add_argument('--pca-dim', type=int, default=int(os.getenv('PCA_DIM', '0')) or None,
+                        help="Reduce vectors to this many dimensions with PCA before storing them")
+    parser.add_argument('--eval-k', type=int, default=5, help="k for the recall@k report")
+    parser.add_argument('--min-recall', type=float, default=0.0,
+                        help="Refuse to publish a rebuilt index whose recall@k against exact float32 search is lower")
+    return parser.parse_args()
+
+
+def chunk_document(path):
+    """Load a PDF and split its pages into chunks (runs in a worker process)"""
+    documents = PyPDFLoader(path).load()
+    chunks = text_splitter.create_documents([doc.page_content for doc in documents],
+                                             metadatas=[doc.metadata for doc in documents])
+    return [chunk.page_content for chunk in chunks], [chunk.metadata for chunk in chunks]
+
+
+def map_in_order(pool, func, items, window):
+    """Like pool.map, but with at most `window` tasks in flight so parsed documents can't pile up"""
+    items = iter(items)
+    pending = deque((item, pool.submit(func, item)) for item in itertools.islice(items, window))
+    while pending:
+        item, future = pending.popleft()
+        result = future.result()
+        for next_item in itertools.islice(items, 1):
+            pending.append((next_item, pool.submit(func, next_item)))
+        yield item, result
+
+
+class StreamingIngest:
+    """
+    Embeds chunks in fixed-size batches as parsed documents arrive, adds the
+    vectors to the index and appends them to the checkpoint. Only one batch of
+    chunks is held in memory at a time.
+    """
+
+    def __init__(self, checkpoint, args):
+        self.checkpoint = checkpoint
+        self.args = args
+        self.plan = checkpoint.state['plan']
+        self.embedder = None
+        self.buffer = []         # (source, text, metadata, chunk_id) waiting to be embedded
+        self.progress = {}       # source -> [first_id, count, written] for documents in flight
+        self.done = dict(checkpoint.state['done'])
+        self.batches = 0
+        self.embedded = 0
+
+        # Vectors of unchanged chunks from earlier runs; a re-index builds the new index from them
+        self.stored = None if self.plan['full_rebuild'] else VectorStore.open(VECTORS_PATH)
+        self.new_index = self.plan['full_rebuild'] or self.plan['reindex']
+        # IVF, PCA and SQ8 indexes need training on the corpus, so a new one is filled at the end;
+        # other flat and HNSW indexes (and any existing index being updated) take vectors as they arrive
+        self.streaming = (not self.new_index
+                          or not needs_training(args.index_type, args.encoding, args.pca_dim))
+        self.index, self.index_meta = None, None
+        if not self.new_index:
+            self.index, self.index_meta = load_index('faiss_index.bin')
+            self.index = remove_vectors(self.index, self.superseded_ids(), self.index_meta)
+            self._replay()
+
+    def _create_index(self, n, dim):
+        self.index, self.index_meta = new_index(
+            self.args.index_type, n, dim,
+            nlist=self.args.nlist,
+            hnsw_m=self.args.hnsw_m,
+            pq_m=self.args.pq_m,
+            nprobe=self.args.nprobe,
+            ef_search=self.args.ef_search,
+            id_mapped=True,
+            encoding=self.args.encoding,
+            pca_dim=self.args.pca_dim,
+        )
+
+    def superseded_ids(self):
+        """
+        Ids this build removes or (re)adds. A resumed build may already have
+        published some of its new chunks before it was interrupted, so every
+        publish step drops these before adding the checkpointed chunks again.
+        """
+        return np.concatenate([np.asarray(self.plan['removed_ids'], dtype=np.int64), self.checkpoint.ids()])
+
+    def vector_batches(self):
+        """(vectors, ids) of every chunk in the finished index: kept stored ones, then this run's"""
+        if self.stored is not None:
+            yield from self.stored.iter_batches(self.args.batch_size, self.superseded_ids())
+        yield from self.checkpoint.iter_batches(self.args.batch_size)
+
+    def _replay(self):
+        """Add the vectors the index is missing: all kept ones for a new index, else those of an interrupted run"""
+        batches = self.vector_batches() if self.new_index else self.checkpoint.iter_batches(self.args.batch_size)
+        for vectors, ids in batches:
+            add_vectors(self.index, vectors, ids)
+
+    def row_count(self):
+        rows = self.checkpoint.rows
+        if self.stored is not None:
+            rows += int(np.count_nonzero(~np.isin(self.stored.ids(), self.superseded_ids())))
+        return rows
+
+    def _training_sample(self, rows, size):
+        """A random sample of the vectors going into the index, read batch by batch"""
+        picks = np.sort(np.random.default_rng(0).choice(rows, size=size, replace=False))
+        sample, seen = [], 0
+        for vectors, _ in self.vector_batches():
+            lo, hi = np.searchsorted(picks, [seen, seen + len(vectors)])
+            sample.append(vectors[picks[lo:hi] - seen])
+            seen += len(vectors)
+        return np.concatenate(sample)
+
+    def add_document(self, source, texts, metadatas):
+        partial = self.checkpoint.state['partial']
+        if partial and partial['source'] == source and partial['count'] == len(texts):
+            first_id, written = partial['start'], partial['written']
+        else:
+            first_id, written = self.checkpoint.allocate_ids(len(texts)), 0
+        self.progress[source] = [first_id, len(texts), written]
+        self._collect_done()
+        for i in range(written, len(texts)):
+            self.buffer.append((source, texts[i], metadatas[i], first_id + i))
+            if len(self.buffer) >= self.args.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        if self.embedder is None:
+            self.embedder = load_embedder(EMBEDDING_BACKEND)
+
+        vectors = self.embedder.encode([text for _, text, _, _ in batch], convert_to_numpy=True)
+        ids = [chunk_id for _, _, _, chunk_id in batch]
+        if self.index is None and self.streaming:
+            self._create_index(0, vectors.shape[1])
+            self._replay()
+        if self.index is not None:
+            add_vectors(self.index, vectors, ids)
+        self.checkpoint.append(vectors, ids, [(text, metadata) for _, text, metadata, _ in batch])
+
+        for source, _, _, _ in batch:
+            self.progress[source][2] += 1
+        self.embedded += len(batch)
+        self._collect_done()
+        self.batches += 1
+        if self.batches % self.args.checkpoint_every == 0:
+            self.commit()
+            print(f"  embedded {self.checkpoint.rows} chunks, "
+                  f"{len(self.done)}/{len(self.plan['to_ingest'])} documents done", flush=True)
+
+    def _collect_done(self):
+        for source, (first_id, count, written) in list(self.progress.items()):
+            if written == count:
+                self.done[source] = [first_id, count]
+                del self.progress[source]
+
+    def commit(self):
+        partial = None
+        for source, (first_id, count, written) in self.progress.items():
+            if written:
+                partial = {'source': source, 'start': first_id, 'count': count, 'written': written}
+        self.checkpoint.commit(self.done, partial)
+
+    def finish(self):
+        """Embed what is left and return the filled (index, meta)"""
+        self.flush()
+        self.commit()
+        if self.index is None:
+            dim = self.checkpoint.state['dimension'] or (self.stored.dimension if self.stored else None)
+            rows = self.row_count()
+            if dim is None or not rows:
+                raise SystemExit("No chunks to index.")
+            self._create_index(rows, dim)
+            if not self.index.is_trained:
+                # Train on a sample read from the on-disk vector logs
+                self.index.train(self._training_sample(rows, train_sample_size(self.index, rows)))
+            self._replay()
+        self.index_meta['ntotal'] = int(self.index.ntotal)
+        return self.index, self.index_meta
+
+
+def can_reindex(manifest):
+    """Whether the stored vectors cover every chunk in the manifest, so a new index needs no re-embedding"""
+    stored = VectorStore.open(VECTORS_PATH)
+    return stored is not None and stored.rows == sum(len(entry['chunk_ids']) for entry in manifest['files'].values())
+
+
+def start_build(args, settings, index_settings):
+    """Plan a new build from the manifest, or return None when nothing changed"""
+    manifest = load_manifest(MANIFEST_PATH, settings)
+    full_rebuild = args.rebuild or not manifest['files'] or not os.path.exists('chunk_store')
+    reindex = not full_rebuild and (
+        manifest.get('index_settings') != index_settings
+        or not os.path.exists('faiss_index.bin')
+        or not load_index_meta('faiss_index.bin').get('id_mapped')
+    )
+    if reindex and not can_reindex(manifest):
+        full_rebuild, reindex = True, False
+    if full_rebuild:
+        manifest = new_manifest(settings)
+
+    changes = plan_changes(manifest, find_sources(args.docs))
+    print(f"Documents: {len(changes.added)} new, {len(changes.changed)} changed, "
+          f"{len(changes.removed)} removed, {len(changes.unchanged)} unchanged")
+    if changes.is_empty and not (full_rebuild or reindex):
+        save_manifest(manifest, MANIFEST_PATH)
+        return None
+    if reindex:
+        print("Rebuilding the index from the stored vectors; unchanged documents are not re-embedded")
+
+    # Chunk ids of changed and removed documents are dropped; nothing else is re-embedded
+    plan = {
+        'full_rebuild': full_rebuild,
+        'reindex': reindex,
+        'index_settings': index_settings,
+        'to_ingest': changes.to_ingest,
+        'removed': changes.removed,
+        'removed_ids': stale_ids(manifest, changes),
+    }
+    return IngestCheckpoint.start(CHECKPOINT_PATH, settings, plan, manifest['next_id'])
+
+
+def main():
+    args = parse_args()
+    run_start = time.perf_counter()
+
+    # Changing how chunks are made or embedded invalidates every vector
+    settings = {
+        'embedding_model': EMBEDDING_MODEL,
+        'embedding_backend': EMBEDDING_BACKEND,
+        'chunk_size': CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP,
+    }
+    # Changing how vectors are indexed only rebuilds the index from the stored vectors
+    index_settings = {
+        'index_type': args.index_type,
+        'encoding': args.encoding,
+        'pca_dim': args.pca_dim,
+    }
+    checkpoint = None if args.rebuild else IngestCheckpoint.resume(CHECKPOINT_PATH, settings)
+    if checkpoint is not None and checkpoint.state['plan']['index_settings'] != index_settings:
+        # The embedded vectors stay valid; only the index they go into changes
+        plan = checkpoint.state['plan']
+        if plan['full_rebuild'] or can_reindex(load_manifest(MANIFEST_PATH, settings)):
+            plan['reindex'] = not plan['full_rebuild']
+            plan['index_settings'] = index_settings
+        else:
+            checkpoint.close()
+            checkpoint = None
+    if checkpoint is not None:
+        print(f"Resuming interrupted build: {len(checkpoint.state['done'])}/"
+              f"{len(checkpoint.state['plan']['to_ingest'])} documents and {checkpoint.rows} chunks already embedded")
+    else:
+        checkpoint = start_build(args, settings, index_settings)
+        if checkpoint is None:
+            print("Index is up to date.")
+            return
+    plan = checkpoint.state['plan']
+
+    # Parse and split PDFs in worker processes while the main process embeds
+    ingest = StreamingIngest(checkpoint, args)
+    remaining = [source for source in plan['to_ingest'] if source not in ingest.done]
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for source, (texts, metadatas) in map_in_order(pool, chunk_document, remaining, 2 * args.workers):
+                ingest.add_document(source, texts, metadatas)
+        index, index_meta = ingest.finish()
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. Progress up to the last checkpoint is kept in {CHECKPOINT_PATH}/; "
+              "run again to resume.")
+        sys.exit(1)
+
+    if ingest.new_index:
+        # Report recall against exact search and query latency for this build
+        index_meta['evaluation'] = evaluate_index(index, ingest.vector_batches, ingest.row_count(), k=args.eval_k)
+        recall = index_meta['evaluation'][f"recall@{index_meta['evaluation']['k']}"]
+        if recall < args.min_recall:
+            print(f"❌ recall@{index_meta['evaluation']['k']} {recall} is below --min-recall {args.min_recall}; "
+                  f"the previous index was left in place. Try a lighter --encoding or a larger --pca-dim.")
+            checkpoint.close()
+            sys.exit(1)
+    if plan['full_rebuild']:
+        with ChunkStoreWriter('chunk_store') as writer:
+            for text, metadata, chunk_id in checkpoint.iter_chunks():
+                writer.add(text, metadata, chunk_id)
+    else:
+        # Kept chunks are copied, not re-encoded
+        update_chunk_store('chunk_store', ingest.superseded_ids(), checkpoint.iter_chunks())
+    index_meta['build_seconds'] = round(time.perf_counter() - run_start, 3)
+    write_index(index, index_meta, 'faiss_index.bin')
+    # Keep the raw vectors so a later change of index settings needs no re-embedding
+    if plan['full_rebuild'] or ingest.stored is not None:
+        VectorStore.write(VECTORS_PATH, ingest.vector_batches())
+
+    # BM25 inverted index used by hybrid retrieval: only removed and new chunks are (re)tokenized
+    store = ChunkStore('chunk_store')
+    if plan['full_rebuild'] or not bm25_index_current('bm25_index'):
+        build_bm25_index(store.texts, 'bm25_index', ids=store.ids)
+    else:
+        update_bm25_index('bm25_index', ingest.superseded_ids(),
+                          ((chunk_id, text) for text, _, chunk_id in checkpoint.iter_chunks()))
+    total_chunks = len(store)
+    store.close()
+
+    # Record the new state last; until then an interrupted run is resumed from the checkpoint
+    manifest = new_manifest(settings) if plan['full_rebuild'] else load_manifest(MANIFEST_PATH, settings)
+    manifest['index_settings'] = index_settings
+    for source in plan['removed']:
+        manifest['files'].pop(source, None)
+    for source, (first_id, count) in ingest.done.items():
+        record_file(manifest, source, list(range(first_id, first_id + count)))
+    manifest['next_id'] = checkpoint.state['next_id']
+    save_manifest(manifest, MANIFEST_PATH)
+    checkpoint.discard()
 
-# Save embeddings and metadata for FAISS
-with open('chunks.pkl', 'wb') as f:
-    pickle.dump({'texts': texts, 'metadatas': metadatas}, f)
+    print(f"{'Rebuilt' if ingest.new_index else 'Updated'} index: embedded {ingest.embedded} chunks, "
+          f"removed {len(plan['removed_ids'])}, {total_chunks} chunks stored "
+          f"({time.perf_counter() - run_start:.1f}s).")
+    print(f"Index: {index_meta['index_type']} ({index_meta['factory']}), {index_meta['ntotal']} vectors, "
+          f"{index_meta['index_bytes'] / 1e6:.1f} MB (compression {index_meta['compression_ratio']}x vs float32)")
+    if ingest.new_index:
+        print(f"Evaluation: {json.dumps(index_meta['evaluation'])}")
 
-# Create FAISS index
-index = faiss.IndexFlatL2(embeddings.shape[1])
-index.add(embeddings)
-faiss.write_index(index, 'faiss_index.bin')
 
-print(f"Stored {len(texts)} chunks and FAISS index.")
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ interface ChatSession {
   messages: Message[]
   createdAt: Date
   updatedAt: Date
+  serverSessionId?: string  // Backend session holding the conversation history
 }
 
 const EXAMPLE_QUESTIONS = [
@@ -177,23 +178,32 @@ export default function Home() {
     setError(null)
 
     try {
-      // Get conversation context (last 5 messages for context)
+      // The backend keeps the history of known sessions; otherwise seed a new
+      // session with the conversation context (last 5 messages)
+      const serverSessionId = currentChat?.serverSessionId
       const context = messages.slice(-5).map(m => ({
         role: m.role,
         content: m.content
       }))
 
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/chat`, {
+      const postChat = (body: object) => fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/chat`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ 
-          message: messageText,
-          context: context
-        }),
+        body: JSON.stringify(body),
       })
 
+      let response = await postChat(serverSessionId
+        ? { message: messageText, session_id: serverSessionId }
+        : { message: messageText, context: context })
+
+      // 409: the backend no longer holds this session (restart, eviction or
+      // another worker), so seed a new one with the recent messages
+      if (response.status === 409 && serverSessionId) {
+        response = await postChat({ message: messageText, context: context })
+      }
+
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
@@ -209,7 +219,7 @@ export default function Home() {
 
       setChatSessions(prev => prev.map(chat => 
         chat.id === currentChatId 
-          ? { ...chat, messages: [...chat.messages, assistantMessage], updatedAt: new Date() }
+          ? { ...chat, messages: [...chat.messages, assistantMessage], updatedAt: new Date(), serverSessionId: data.session_id }
           : chat
       ))
     } catch (err) {
@@ -256,8 +266,10 @@ export default function Home() {
         headers: {
           'Content-Type': 'application/json',
         },
+        // Re-seed the backend session with the history up to this message
         body: JSON.stringify({ 
           message: userMessage.content,
+          session_id: currentChat?.serverSessionId,
           context: context
         }),
       })
@@ -277,7 +289,7 @@ export default function Home() {
 
       setChatSessions(prev => prev.map(chat => 
         chat.id === currentChatId 
-          ? { ...chat, messages: [...chat.messages, assistantMessage] }
+          ? { ...chat, messages: [...chat.messages, assistantMessage], serverSessionId: data.session_id }
           : chat
       ))
     } catch (err) {
@@ -335,7 +347,7 @@ export default function Home() {
     if (index !== -1) {
       setChatSessions(prev => prev.map(chat => 
         chat.id === currentChatId 
-          ? { ...chat, messages: chat.messages.slice(0, index) }
+          ? { ...chat, messages: chat.messages.slice(0, index), serverSessionId: undefined }
           : chat
       ))
     }
@@ -381,7 +393,7 @@ export default function Home() {
     if (confirm('Clear all messages in this chat?')) {
       setChatSessions(prev => prev.map(chat => 
         chat.id === currentChatId 
-          ? { ...chat, messages: [], title: 'New Chat' }
+          ? { ...chat, messages: [], title: 'New Chat', serverSessionId: undefined }
           : chat
       ))
       setError(null)